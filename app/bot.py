@@ -2,28 +2,44 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from typing import Callable, Dict, Any, Awaitable
-from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 from app.config import config
-from app.database.models import Base
+from app.database.engine import create_engine, log_sqlite_pragmas
+from app.database.migrations import run_migrations
+from app.database.query_budget import track_queries
+from app.database.fsm_storage import SQLiteStorage
 from app.handlers import user, admin
+from app.middlewares import (
+    DbSessionMiddleware, MetricsMiddleware, HandlerNameMiddleware, QuerySamplingMiddleware, ThrottlingMiddleware, RateLimit,
+    CallbackCoalescingMiddleware
+)
+from app.keyboards.builders import AddToCart, CancelCheckout, ConfirmReceipt
+from app.services.broadcast import Broadcaster
+from app.services.outbox import OutboxWorker
+from app.services.notifications import wait_pending_notifications
+from app.services.metrics import MetricsServer, count_sql_statements
 
 # Настройка логирования для вывода информации о работе бота
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 
 # Главная асинхронная функция запуска бота
 async def main():
-    # Создаем асинхронный движок для работы с базой данных SQLite
-    engine = create_async_engine('sqlite+aiosqlite:///db/database.db', echo=True) # echo=True выводит SQL-запросы в консоль
+    # Создаем асинхронный движок для работы с базой данных SQLite (пул и PRAGMA задаются в конфиге)
+    engine = create_engine()
     # Создаем фабрику сессий для асинхронной работы с БД
     session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
-    # Создаем все таблицы, описанные в models.py, если их еще нет
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Применяем миграции схемы: создаем таблицы и индексы или обновляем существующую базу
+    await run_migrations(engine)
+    # Проверяем, что PRAGMA действительно применились
+    await log_sqlite_pragmas(engine)
+    # Считаем SQL-запросы для метрик и для выборочной проверки запросов
+    count_sql_statements(engine)
+    track_queries(engine)
 
     # Инициализируем бота с токеном из конфига
     bot = Bot(
@@ -31,40 +47,122 @@ async def main():
         # Устанавливаем parse_mode по умолчанию, чтобы не указывать его в каждом send_message
         default=DefaultBotProperties(parse_mode='HTML')
     )
+    # Собираем диспетчер со всеми роутерами, middleware и фоновыми сервисами
+    dp = create_dispatcher(bot, session_maker)
+
+    # Локальный HTTP-сервер с метриками работает, пока работает бот
+    if config.metrics_enabled:
+        metrics_server = MetricsServer(config.metrics_host, config.metrics_port)
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.stop)
+
+    if config.bot_mode == 'webhook':
+        await run_webhook(bot, dp)
+    else:
+        # Удаляем вебхук перед запуском (накопившиеся обновления пропускаем, только если это включено)
+        await bot.delete_webhook(drop_pending_updates=config.drop_pending_updates)
+        # Запускаем поллинг (опрос серверов Telegram на наличие новых сообщений)
+        await dp.start_polling(bot)
+
+
+# Сборка диспетчера: хранилище FSM, фоновые сервисы, middleware и роутеры.
+# Вынесена отдельно, чтобы тот же диспетчер можно было собрать в бенчмарках (см. benchmarks/)
+def create_dispatcher(bot: Bot, session_maker: async_sessionmaker) -> Dispatcher:
+    # Движок рассылок работает в фоне и доступен хэндлерам как аргумент broadcaster
+    broadcaster = Broadcaster(bot, session_maker)
+    # Обработчик очереди уведомлений (outbox) доступен хэндлерам как аргумент outbox
+    outbox = OutboxWorker(bot, session_maker)
+
+    # Хранилище FSM: по умолчанию состояния сохраняются в SQLite и переживают перезапуск
+    if config.fsm_storage == 'sqlite':
+        storage = SQLiteStorage(session_maker, flush_interval=config.fsm_flush_interval, ttl=config.fsm_state_ttl)
+    else:
+        storage = MemoryStorage()
+
     # Инициализируем диспетчер для обработки входящих обновлений
-    dp = Dispatcher()
+    dp = Dispatcher(storage=storage, broadcaster=broadcaster, outbox=outbox)
+    # Продолжаем прерванные рассылки при запуске и останавливаем их при завершении
+    dp.startup.register(broadcaster.resume_pending)
+    dp.shutdown.register(broadcaster.stop)
+    # Очередь уведомлений отправляется в фоне, пока бот запущен
+    dp.startup.register(outbox.start)
+    dp.shutdown.register(outbox.stop)
+    # При остановке даем уйти уже поставленным уведомлениям админам
+    dp.shutdown.register(wait_pending_notifications)
+
+    # Метрики: время, исключения и SQL-запросы считаются для каждого обновления целиком
+    dp.update.outer_middleware(MetricsMiddleware())
+    # Выборочно проверяем обновления на лишние и повторяющиеся SQL-запросы
+    if config.query_sample_rate > 0:
+        dp.update.outer_middleware(QuerySamplingMiddleware(config.query_sample_rate, config.query_budget))
+
+    # Повторное нажатие той же кнопки, пока первое еще обрабатывается, сразу получает ответ и не доходит
+    # до хэндлера. Регистрируется раньше антифлуда, чтобы двойные нажатия не тратили лимит пользователя
+    dp.callback_query.outer_middleware(CallbackCoalescingMiddleware())
+
+    # Антифлуд: лишние сообщения и нажатия отбрасываются до фильтров и хэндлеров, не доходя до БД.
+    # Для действий с записью (корзина, шаги оформления заказа) лимит строже. Админов не ограничиваем
+    throttling_middleware = ThrottlingMiddleware(
+        message_limit=RateLimit(config.throttle_message_rate, config.throttle_message_burst),
+        callback_limit=RateLimit(config.throttle_callback_rate, config.throttle_callback_burst),
+        write_limit=RateLimit(config.throttle_write_rate, config.throttle_write_burst),
+        write_callbacks=(AddToCart.__prefix__, CancelCheckout.__prefix__, ConfirmReceipt.__prefix__, 'checkout', 'clear_cart'),
+        write_states=(f'{user.Checkout.__full_group_name__}:',),
+        exempt_user_ids=config.admin_ids,
+        max_buckets=config.throttle_max_users
+    )
+    dp.message.outer_middleware(throttling_middleware)
+    dp.callback_query.outer_middleware(throttling_middleware)
+
+    # Сессия БД передается только хэндлерам, которые ее принимают, и открывается при первом запросе.
+    # Middleware внутренний (inner), поэтому срабатывает уже после выбора хэндлера фильтрами
+    handler_name_middleware = HandlerNameMiddleware()
+    db_session_middleware = DbSessionMiddleware(session_pool=session_maker)
+    for router in (user.router, admin.router):
+        for observer in (router.message, router.callback_query, router.inline_query):
+            observer.middleware(handler_name_middleware)  # Имя хэндлера для меток метрик
+            observer.middleware(db_session_middleware)
 
-    # Регистрируем Middleware для добавления сессии БД в каждый обработчик
-    dp.update.middleware(DbSessionMiddleware(session_pool=session_maker))
-    
     # Подключаем роутеры с обработчиками
     dp.include_router(user.router)  # Пользовательские хэндлеры
     dp.include_router(admin.router) # Админские хэндлеры
+    return dp
+
 
-    # Удаляем вебхук и пропускаем накопившиеся обновления перед запуском
-    await bot.delete_webhook(drop_pending_updates=True)
-    # Запускаем поллинг (опрос серверов Telegram на наличие новых сообщений)
-    await dp.start_polling(bot)
-
-# Middleware для управления сессиями базы данных
-class DbSessionMiddleware(BaseMiddleware):
-    def __init__(self, session_pool: async_sessionmaker):
-        self.session_pool = session_pool
-
-    # Этот метод вызывается для каждого входящего обновления (сообщения, колбэка и т.д.)
-    async def __call__(
-        self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: TelegramObject,
-        data: Dict[str, Any],
-    ) -> Any:
-        # Открываем новую сессию из пула
-        async with self.session_pool() as session:
-            # "Прокидываем" сессию в данные, доступные внутри хэндлера
-            data["session"] = session
-            # Вызываем следующий обработчик в цепочке, передавая ему обновленные данные
-            return await handler(event, data)
+# Запуск бота в режиме вебхука: Telegram сам присылает обновления на встроенный aiohttp-сервер
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    secret_token = config.webhook_secret.get_secret_value() if config.webhook_secret else None
 
+    async def on_startup(bot: Bot):
+        if not config.webhook_base_url:
+            # Без публичного адреса вебхук не регистрируем: удобно для локальной проверки,
+            # когда обновления отправляются на сервер вручную (например, через curl)
+            logging.warning("WEBHOOK_BASE_URL не задан, вебхук в Telegram не зарегистрирован")
+            return
+        await bot.set_webhook(
+            url=config.webhook_base_url.rstrip('/') + config.webhook_path,
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=config.drop_pending_updates
+        )
+
+    dp.startup.register(on_startup)
+
+    app = web.Application()
+    # Обработчик проверяет заголовок X-Telegram-Bot-Api-Secret-Token и передает обновление в диспетчер
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token).register(app, path=config.webhook_path)
+    # Связываем жизненный цикл веб-приложения с startup/shutdown диспетчера
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.webhook_host, port=config.webhook_port)
+    await site.start()
+    logging.info(f"Вебхук слушает http://{config.webhook_host}:{config.webhook_port}{config.webhook_path}")
+    try:
+        await asyncio.Event().wait()  # Работаем до остановки процесса
+    finally:
+        await runner.cleanup()
 
 # Точка входа в приложение
 if __name__ == '__main__':
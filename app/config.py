@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr
 
@@ -10,6 +12,67 @@ class Settings(BaseSettings):
     bank_card_number: str # Номер банковской карты для приема платежей
     bank_card_owner: str  # Владелец банковской карты для приема платежей
 
+    # Способ получения обновлений: 'polling' (по умолчанию) или 'webhook'
+    bot_mode: Literal['polling', 'webhook'] = 'polling'
+    drop_pending_updates: bool = False  # Пропускать ли накопившиеся обновления при запуске
+
+    # Настройки режима вебхука
+    webhook_base_url: str | None = None  # Публичный HTTPS-адрес бота (если не задан, вебхук не регистрируется в Telegram)
+    webhook_path: str = '/webhook'       # Путь, на который Telegram присылает обновления
+    webhook_host: str = '0.0.0.0'        # Адрес, на котором слушает встроенный веб-сервер
+    webhook_port: int = 8080             # Порт встроенного веб-сервера
+    webhook_secret: SecretStr | None = None  # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+
+    # База данных
+    database_url: str = 'sqlite+aiosqlite:///db/database.db'  # Адрес БД для SQLAlchemy
+    db_echo: bool = False       # Выводить все SQL-запросы в лог (только для отладки)
+    db_pool_size: int = 5       # Количество постоянных соединений в пуле
+    db_max_overflow: int = 10   # Сколько соединений можно открыть сверх пула при всплеске нагрузки
+    db_pool_timeout: float = 30 # Сколько секунд ждать свободное соединение из пула
+
+    # Параметры SQLite (PRAGMA), применяются к каждому соединению
+    sqlite_journal_mode: Literal['WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY'] = 'WAL'  # WAL: чтение не блокируется записью
+    sqlite_synchronous: Literal['OFF', 'NORMAL', 'FULL', 'EXTRA'] = 'NORMAL'  # В режиме WAL NORMAL надежен и заметно быстрее FULL
+    sqlite_busy_timeout: int = 5000           # Сколько миллисекунд ждать снятия блокировки вместо ошибки "database is locked"
+    sqlite_cache_size: int = -65536           # Размер кэша страниц (отрицательное значение - в КиБ, здесь 64 МиБ)
+    sqlite_mmap_size: int = 268_435_456       # Объем файла БД, читаемый через mmap (в байтах, здесь 256 МиБ)
+    sqlite_temp_store: Literal['DEFAULT', 'FILE', 'MEMORY'] = 'MEMORY'  # Где хранить временные таблицы и индексы
+
+    # Метрики в формате Prometheus (http://<metrics_host>:<metrics_port>/metrics)
+    metrics_enabled: bool = True     # Запускать ли HTTP-сервер с метриками
+    metrics_host: str = '127.0.0.1'  # Адрес сервера метрик (в Docker - 0.0.0.0)
+    metrics_port: int = 9101         # Порт сервера метрик
+
+    # Выборочная проверка SQL-запросов в продакшене (повторы, N+1, превышение бюджета пишутся в лог)
+    query_sample_rate: float = 0.0  # Доля проверяемых обновлений (0 - выключено, 1 - все)
+    query_budget: int = 15          # Сколько SQL-запросов на одно обновление считается нормой
+
+    # Антифлуд: корзины токенов на пользователя (rate - токенов в секунду, burst - сколько действий подряд)
+    throttle_message_rate: float = 1.0   # Обычные сообщения
+    throttle_message_burst: int = 5
+    throttle_callback_rate: float = 2.0  # Нажатия кнопок
+    throttle_callback_burst: int = 8
+    throttle_write_rate: float = 0.5     # Действия с записью в БД: добавление в корзину, шаги оформления заказа
+    throttle_write_burst: int = 3
+    throttle_max_users: int = 100_000    # Максимум корзин в памяти (простаивающие удаляются автоматически)
+
+    # Инлайн-режим (@бот запрос): сколько секунд Telegram может отдавать ответ на запрос из своего кэша
+    inline_cache_time: int = 300
+
+    # Хранилище FSM-состояний: 'sqlite' (переживает перезапуск) или 'memory'
+    fsm_storage: Literal['sqlite', 'memory'] = 'sqlite'
+    fsm_flush_interval: float = 1.0     # Как часто сбрасывать изменения состояний в БД (в секундах)
+    fsm_state_ttl: int = 7 * 24 * 3600  # Через сколько секунд без изменений состояние считается устаревшим
+
+    # Кэш пользователей (tg_id -> ID в БД), избавляет от запроса к БД почти на каждое обновление
+    user_cache_size: int = 100_000  # Максимальное количество пользователей в кэше
+    user_cache_ttl: int = 3600      # Время жизни записи в кэше (в секундах)
+
+    # Рассылка (Bot API допускает около 30 сообщений в секунду в разные чаты)
+    mailing_rate_limit: float = 25  # Максимум сообщений в секунду
+    mailing_concurrency: int = 10   # Максимум одновременных запросов к Bot API (и сообщений между сохранениями прогресса)
+    mailing_batch_size: int = 200   # Сколько пользователей читать из БД за один запрос
+
     # Конфигурация для загрузки настроек из файла .env
     model_config = SettingsConfigDict(
         env_file=(
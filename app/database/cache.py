@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.config import config
+
+
+# Снимок идентичности пользователя: все, что нужно хэндлерам, чтобы не ходить в БД
+@dataclass(frozen=True, slots=True)
+class UserIdentity:
+    id: int                # ID пользователя в нашей БД
+    tg_id: int             # Telegram ID пользователя
+    username: str | None   # Последний известный username
+
+
+class IdentityCache:
+    """
+    Ограниченный по размеру LRU-кэш с TTL для соответствия tg_id -> UserIdentity.
+    Живет в памяти процесса; устаревшие записи вытесняются по времени жизни,
+    а самые давно использованные - при превышении размера.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[int, tuple[UserIdentity, float]] = OrderedDict()
+
+    def get(self, tg_id: int) -> UserIdentity | None:
+        """Возвращает закэшированного пользователя или None, если записи нет или она устарела."""
+        entry = self._items.get(tg_id)
+        if entry is None:
+            return None
+        identity, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._items[tg_id]
+            return None
+        self._items.move_to_end(tg_id)  # Отмечаем запись как недавно использованную
+        return identity
+
+    def set(self, identity: UserIdentity):
+        """Сохраняет пользователя в кэш, вытесняя самые старые записи при переполнении."""
+        self._items[identity.tg_id] = (identity, time.monotonic() + self.ttl)
+        self._items.move_to_end(identity.tg_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, tg_id: int):
+        """Удаляет пользователя из кэша."""
+        self._items.pop(tg_id, None)
+
+    def clear(self):
+        """Полностью очищает кэш."""
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Общий для всего приложения кэш пользователей
+identity_cache = IdentityCache(max_size=config.user_cache_size, ttl=config.user_cache_ttl)
+
+
+class CatalogVersion:
+    """
+    Счетчик версий каталога. Увеличивается при каждом изменении товаров,
+    по нему кэши, построенные на данных каталога, понимают, что устарели.
+    Дополнительно хранит версии отдельных товаров, чтобы при правке одного товара
+    перестраивалась только его карточка.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._products: dict[int, int] = {}
+
+    def bump(self, product_id: int | None = None):
+        """Отмечает каталог (и, если указан, конкретный товар) как измененный."""
+        self.value += 1
+        if product_id is not None:
+            self._products[product_id] = self.value
+
+    def product(self, product_id: int) -> int:
+        """Версия конкретного товара (0, если товар не менялся с момента запуска)."""
+        return self._products.get(product_id, 0)
+
+
+# Общая для всего приложения версия каталога
+catalog_version = CatalogVersion()
@@ -0,0 +1,58 @@
+import logging
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.config import config
+
+# Получаем логгер для этого модуля
+logger = logging.getLogger(__name__)
+
+# PRAGMA, значения которых проверяются и выводятся в лог при запуске
+CHECKED_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store')
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Применяет PRAGMA к каждому новому соединению SQLite.
+    Большинство из них действуют только в рамках соединения, поэтому их нельзя выставить один раз.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout)}")
+    cursor.execute(f"PRAGMA cache_size={int(config.sqlite_cache_size)}")
+    cursor.execute(f"PRAGMA mmap_size={int(config.sqlite_mmap_size)}")
+    cursor.execute(f"PRAGMA temp_store={config.sqlite_temp_store}")
+    cursor.close()
+
+
+def create_engine() -> AsyncEngine:
+    """Создает асинхронный движок БД по настройкам из конфига."""
+    engine = create_async_engine(
+        config.database_url,
+        echo=config.db_echo,  # Вывод всех SQL-запросов в лог - только для отладки
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout
+    )
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', _set_sqlite_pragmas)
+    return engine
+
+
+async def log_sqlite_pragmas(engine: AsyncEngine) -> dict[str, str]:
+    """Проверка при запуске: читает фактические значения PRAGMA и выводит их в лог."""
+    if engine.dialect.name != 'sqlite':
+        return {}
+    values = {}
+    async with engine.connect() as conn:
+        for pragma in CHECKED_PRAGMAS:
+            values[pragma] = str((await conn.execute(text(f"PRAGMA {pragma}"))).scalar())
+    logger.info("Параметры SQLite: " + ", ".join(f"{name}={value}" for name, value in values.items()))
+    if values['journal_mode'].lower() != config.sqlite_journal_mode.lower():
+        logger.warning(
+            f"Не удалось включить journal_mode={config.sqlite_journal_mode}, "
+            f"используется {values['journal_mode']}"
+        )
+    return values
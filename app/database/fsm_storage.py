@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.models import FsmState
+
+# Получаем логгер для этого модуля
+logger = logging.getLogger(__name__)
+
+# Как часто (в секундах) удалять из БД просроченные состояния
+CLEANUP_INTERVAL = 600
+
+
+@dataclass
+class _Record:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в существующей базе SQLite (таблица fsm_states).
+
+    Чтение идет из кэша в памяти: запись из БД загружается один раз при первом обращении.
+    Изменения сначала попадают в кэш и помечаются "грязными", а фоновая задача раз в
+    flush_interval секунд сбрасывает их в БД одной транзакцией (write-behind), поэтому шаги
+    оформления заказа не ждут синхронной записи в БД. Состояния, не менявшиеся дольше ttl
+    секунд, считаются устаревшими и удаляются.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, flush_interval: float = 1.0, ttl: float = 7 * 24 * 3600,
+                 cache_size: int = 10_000):
+        self.session_pool = session_pool
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flushing: set[str] = set()  # Ключи, запись которых в БД еще не завершена
+        self._flush_task: asyncio.Task | None = None
+        self._last_cleanup = 0.0
+
+    @staticmethod
+    def _build_key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.business_connection_id or '', key.chat_id,
+            key.thread_id or '', key.user_id, key.destiny
+        ))
+
+    def _is_expired(self, record: _Record) -> bool:
+        return record.updated_at < time.time() - self.ttl
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        """Возвращает запись из кэша, при промахе загружая ее из БД."""
+        storage_key = self._build_key(key)
+        record = self._cache.get(storage_key)
+        if record is None:
+            async with self.session_pool() as session:
+                row = await session.get(FsmState, storage_key)
+            record = _Record()
+            if row is not None:
+                record = _Record(state=row.state, data=json.loads(row.data), updated_at=row.updated_at)
+            # Пока шла загрузка, запись могла появиться в кэше из параллельного обновления
+            record = self._cache.setdefault(storage_key, record)
+            self._evict()
+        else:
+            self._cache.move_to_end(storage_key)
+
+        if not record.is_empty and self._is_expired(record):
+            # Состояние устарело - сбрасываем его (и удаляем из БД при следующей записи)
+            record = _Record()
+            self._cache[storage_key] = record
+            self._dirty.add(storage_key)
+        return record
+
+    def _mark_dirty(self, key: StorageKey, record: _Record):
+        storage_key = self._build_key(key)
+        record.updated_at = time.time()
+        self._cache[storage_key] = record
+        self._cache.move_to_end(storage_key)
+        self._dirty.add(storage_key)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(), name='fsm-storage-flush')
+
+    def _is_pending(self, storage_key: str) -> bool:
+        """Изменения записи еще не сохранены в БД (ждут сброса или сбрасываются прямо сейчас)."""
+        return storage_key in self._dirty or storage_key in self._flushing
+
+    def _evict(self):
+        """Вытесняет из кэша давно не использованные записи, которые уже сохранены в БД."""
+        while len(self._cache) > self.cache_size:
+            for storage_key in self._cache:
+                if not self._is_pending(storage_key):
+                    del self._cache[storage_key]
+                    break
+            else:
+                return  # Все записи еще не сохранены - подождем сброса в БД
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._get_record(key)
+        record.data = dict(data)
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._get_record(key)).data)
+
+    async def flush(self):
+        """Сбрасывает все накопленные изменения в БД одной транзакцией."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        # Снимок берется до первого await: пока идет запись, записи могут меняться или
+        # вытесняться из кэша, а в БД должно попасть именно то, что было на момент сброса.
+        # Ключи из _flushing не вытесняются, иначе промах кэша прочитал бы из БД старое значение.
+        snapshot = {}
+        for storage_key in dirty:
+            record = self._cache.get(storage_key)
+            if record is None:
+                continue  # Промах кэша - не повод удалять состояние из БД
+            snapshot[storage_key] = None if record.is_empty else {
+                'key': storage_key,
+                'state': record.state,
+                'data': json.dumps(record.data, ensure_ascii=False),
+                'updated_at': record.updated_at
+            }
+        self._flushing = set(snapshot)
+        try:
+            async with self.session_pool() as session:
+                for storage_key, values in snapshot.items():
+                    if values is None:
+                        await session.execute(delete(FsmState).where(FsmState.key == storage_key))
+                        continue
+                    await session.execute(
+                        sqlite_insert(FsmState).values(**values)
+                        .on_conflict_do_update(index_elements=[FsmState.key], set_=values)
+                    )
+                await session.commit()
+        except Exception:
+            self._dirty |= dirty  # Не потеряем изменения - попробуем при следующем сбросе
+            raise
+        finally:
+            self._flushing = set()
+        self._evict()
+
+    async def _cleanup_expired(self):
+        """Удаляет из БД и кэша состояния, не менявшиеся дольше ttl."""
+        threshold = time.time() - self.ttl
+        async with self.session_pool() as session:
+            await session.execute(delete(FsmState).where(FsmState.updated_at < threshold))
+            await session.commit()
+        for storage_key in [k for k, r in self._cache.items() if r.updated_at < threshold and not self._is_pending(k)]:
+            del self._cache[storage_key]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_cleanup >= CLEANUP_INTERVAL:
+                    self._last_cleanup = time.monotonic()
+                    await self._cleanup_expired()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить FSM-состояния в БД: {e}")
+
+    async def close(self) -> None:
+        """Останавливает фоновый сброс и сохраняет оставшиеся изменения."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
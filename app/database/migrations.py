@@ -0,0 +1,344 @@
+import logging
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Получаем логгер для этого модуля
+logger = logging.getLogger(__name__)
+
+# Реестр миграций: (версия, описание, функция применения).
+# Каждая миграция получает синхронное соединение и выполняется в отдельной транзакции.
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    """Декоратор для регистрации миграции схемы с указанным номером версии."""
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def _column_exists(conn: Connection, table: str, column: str) -> bool:
+    """Проверяет, есть ли в таблице указанный столбец (SQLite не поддерживает ADD COLUMN IF NOT EXISTS)."""
+    columns = conn.execute(text(f"PRAGMA table_info({table})")).all()
+    return any(row.name == column for row in columns)
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    """Добавляет столбец в таблицу, если его еще нет."""
+    if not _column_exists(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+# --- Миграции ---
+
+@migration(1, 'Базовая схема')
+def _initial_schema(conn: Connection):
+    """
+    Создает исходные таблицы в том виде, в котором их создавал Base.metadata.create_all.
+    Для уже существующей базы ничего не меняет.
+    """
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER NOT NULL,
+            tg_id BIGINT,
+            username VARCHAR(100),
+            PRIMARY KEY (id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            description VARCHAR(255),
+            price FLOAT NOT NULL,
+            photo_id VARCHAR NOT NULL,
+            PRIMARY KEY (id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS cart_items (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES users (id),
+            FOREIGN KEY(product_id) REFERENCES products (id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status VARCHAR(50) NOT NULL,
+            delivery_pickup_point VARCHAR(255),
+            recipient_full_name VARCHAR(150),
+            recipient_phone_number VARCHAR(20),
+            receipt_file_id VARCHAR,
+            cdek_track_number VARCHAR,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES users (id)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER NOT NULL,
+            order_id INTEGER NOT NULL,
+            product_name VARCHAR(100) NOT NULL,
+            product_price FLOAT NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(order_id) REFERENCES orders (id)
+        )
+    """))
+
+
+@migration(2, 'Индексы для частых запросов и уникальность users.tg_id')
+def _hot_path_indexes(conn: Connection):
+    """
+    Добавляет индексы на поля, по которым бот ищет записи почти в каждом обновлении,
+    и делает tg_id уникальным. Перед созданием уникального индекса схлопывает
+    дубликаты пользователей, переназначая их корзины и заказы на самую раннюю запись.
+    """
+    duplicates = conn.execute(text("""
+        SELECT u.id AS duplicate_id, keep.keep_id
+        FROM users u
+        JOIN (
+            SELECT tg_id, MIN(id) AS keep_id FROM users
+            WHERE tg_id IS NOT NULL
+            GROUP BY tg_id HAVING COUNT(*) > 1
+        ) keep ON u.tg_id = keep.tg_id
+        WHERE u.id != keep.keep_id
+    """)).all()
+    for duplicate_id, keep_id in duplicates:
+        params = {'duplicate_id': duplicate_id, 'keep_id': keep_id}
+        conn.execute(text("UPDATE cart_items SET user_id = :keep_id WHERE user_id = :duplicate_id"), params)
+        conn.execute(text("UPDATE orders SET user_id = :keep_id WHERE user_id = :duplicate_id"), params)
+        conn.execute(text("DELETE FROM users WHERE id = :duplicate_id"), params)
+    if duplicates:
+        logger.warning(f"Объединено дубликатов пользователей: {len(duplicates)}")
+
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_tg_id ON users (tg_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cart_items_user_id ON cart_items (user_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_user_id ON orders (user_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_status ON orders (status)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)"))
+
+
+@migration(3, 'Количество товара в корзине и в заказе')
+def _item_quantities(conn: Connection):
+    """
+    Добавляет столбец quantity в cart_items и order_items и схлопывает
+    строки "по одной на единицу товара" в одну строку с количеством.
+    """
+    _add_column(conn, 'cart_items', 'quantity', 'INTEGER NOT NULL DEFAULT 1')
+    conn.execute(text("""
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(c.quantity) FROM cart_items c
+            WHERE c.user_id = cart_items.user_id AND c.product_id = cart_items.product_id
+        )
+        WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id HAVING COUNT(*) > 1)
+    """))
+    conn.execute(text("DELETE FROM cart_items WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id)"))
+    # Уникальный индекс нужен для upsert в add_to_cart и заменяет собой индекс по user_id
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_items_user_product ON cart_items (user_id, product_id)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS ix_cart_items_user_id"))
+
+    _add_column(conn, 'order_items', 'quantity', 'INTEGER NOT NULL DEFAULT 1')
+    conn.execute(text("""
+        UPDATE order_items SET quantity = (
+            SELECT SUM(i.quantity) FROM order_items i
+            WHERE i.order_id = order_items.order_id
+              AND i.product_name = order_items.product_name
+              AND i.product_price = order_items.product_price
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM order_items
+            GROUP BY order_id, product_name, product_price HAVING COUNT(*) > 1
+        )
+    """))
+    conn.execute(text("""
+        DELETE FROM order_items WHERE id NOT IN (
+            SELECT MIN(id) FROM order_items GROUP BY order_id, product_name, product_price
+        )
+    """))
+
+
+@migration(4, 'Таблица рассылок с сохранением прогресса')
+def _mailings(conn: Connection):
+    """Создает таблицу рассылок, по которой фоновые рассылки продолжаются после перезапуска."""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS mailings (
+            id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            admin_chat_id BIGINT,
+            progress_message_id INTEGER,
+            cursor INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            sent_count INTEGER NOT NULL,
+            failed_count INTEGER NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (id)
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_mailings_status ON mailings (status)"))
+
+
+@migration(5, 'Счетчики статистики магазина')
+def _shop_stats(conn: Connection):
+    """Создает таблицу счетчиков статистики и заполняет ее по текущим данным."""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS shop_stats (
+            id INTEGER NOT NULL,
+            total_users INTEGER NOT NULL,
+            new_orders INTEGER NOT NULL,
+            paid_orders INTEGER NOT NULL,
+            processing_orders INTEGER NOT NULL,
+            shipped_orders INTEGER NOT NULL,
+            completed_orders INTEGER NOT NULL,
+            canceled_orders INTEGER NOT NULL,
+            total_revenue FLOAT NOT NULL,
+            PRIMARY KEY (id)
+        )
+    """))
+    conn.execute(text("""
+        INSERT OR REPLACE INTO shop_stats VALUES (
+            1,
+            (SELECT COUNT(*) FROM users),
+            (SELECT COUNT(*) FROM orders WHERE status = 'new'),
+            (SELECT COUNT(*) FROM orders WHERE status = 'paid'),
+            (SELECT COUNT(*) FROM orders WHERE status = 'processing'),
+            (SELECT COUNT(*) FROM orders WHERE status = 'shipped'),
+            (SELECT COUNT(*) FROM orders WHERE status = 'completed'),
+            (SELECT COUNT(*) FROM orders WHERE status = 'canceled'),
+            (SELECT COALESCE(SUM(i.product_price * i.quantity), 0)
+             FROM order_items i JOIN orders o ON i.order_id = o.id WHERE o.status = 'completed')
+        )
+    """))
+
+
+@migration(6, 'Хранилище FSM-состояний')
+def _fsm_states(conn: Connection):
+    """Создает таблицу для FSM-состояний, чтобы незавершенные сценарии переживали перезапуск."""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key VARCHAR(255) NOT NULL,
+            state VARCHAR(255),
+            data TEXT NOT NULL,
+            updated_at FLOAT NOT NULL,
+            PRIMARY KEY (key)
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_fsm_states_updated_at ON fsm_states (updated_at)"))
+
+
+@migration(7, 'Очередь исходящих уведомлений (outbox)')
+def _outbox(conn: Connection):
+    """Создает таблицу уведомлений, которые записываются вместе с изменением заказа и отправляются в фоне."""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER NOT NULL,
+            chat_id BIGINT NOT NULL,
+            text TEXT NOT NULL,
+            reply_markup TEXT,
+            status VARCHAR(20) NOT NULL,
+            attempts INTEGER NOT NULL,
+            next_attempt_at FLOAT NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (id)
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_outbox_status_next_attempt_at ON outbox (status, next_attempt_at)"
+    ))
+
+
+@migration(8, 'Сумма и количество товаров в заказе')
+def _order_totals(conn: Connection):
+    """
+    Добавляет в заказы сумму и количество единиц товара и заполняет их по order_items,
+    чтобы списки заказов, отчеты и статистика не суммировали товары при каждом запросе.
+    """
+    _add_column(conn, 'orders', 'total_amount', 'FLOAT NOT NULL DEFAULT 0')
+    _add_column(conn, 'orders', 'item_count', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute(text("""
+        UPDATE orders SET
+            total_amount = COALESCE((
+                SELECT SUM(product_price * quantity) FROM order_items WHERE order_items.order_id = orders.id
+            ), 0),
+            item_count = COALESCE((
+                SELECT SUM(quantity) FROM order_items WHERE order_items.order_id = orders.id
+            ), 0)
+    """))
+    # Индекс по статусу становится префиксом нового составного индекса
+    conn.execute(text("DROP INDEX IF EXISTS ix_orders_status"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_orders_status_total_amount ON orders (status, total_amount)"
+    ))
+
+
+@migration(9, 'Полнотекстовый поиск по товарам (FTS5)')
+def _products_fts(conn: Connection):
+    """
+    Создает FTS5-индекс по названию и описанию товаров (rowid совпадает с ID товара)
+    и заполняет его текущими товарами. Дальше индекс обновляется функциями из requests.py.
+    """
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts "
+        "USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')"
+    ))
+    conn.execute(text("DELETE FROM products_fts"))
+    # Буква ё индексируется как е, чтобы "ежик" находил "Ёжик" (токенизатор их не отождествляет)
+    conn.execute(text("""
+        INSERT INTO products_fts (rowid, name, description)
+        SELECT id,
+               replace(replace(name, 'ё', 'е'), 'Ё', 'Е'),
+               replace(replace(COALESCE(description, ''), 'ё', 'е'), 'Ё', 'Е')
+        FROM products
+    """))
+
+
+# --- Запуск миграций ---
+
+def _ensure_version_table(conn: Connection):
+    """Создает служебную таблицу с примененными версиями схемы."""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER NOT NULL PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """))
+
+
+def _applied_versions(conn: Connection) -> set[int]:
+    """Возвращает множество уже примененных версий."""
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+async def run_migrations(engine: AsyncEngine):
+    """
+    Применяет к базе все еще не примененные миграции по возрастанию версии.
+    Каждая миграция вместе с записью о ней выполняется в собственной транзакции,
+    поэтому прерванный запуск продолжится с той же версии при следующем старте.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(_ensure_version_table)
+        applied = await conn.run_sync(_applied_versions)
+
+    for version, description, apply in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        logger.info(f"Применяю миграцию {version}: {description}")
+        async with engine.begin() as conn:
+            await conn.run_sync(apply)
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.now()}
+            )
@@ -1,8 +1,12 @@
-from sqlalchemy import BigInteger, String, Float, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import BigInteger, String, Text, Float, ForeignKey, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import AsyncAttrs
 
-# Базовый класс для всех моделей SQLAlchemy, с поддержкой асинхронных операций
+# Базовый класс для всех моделей SQLAlchemy, с поддержкой асинхронных операций.
+# Схема в базе создается и обновляется миграциями из migrations.py, а не через create_all,
+# поэтому любые изменения моделей должны сопровождаться новой миграцией.
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
@@ -13,7 +17,7 @@ class User(Base):
     
     # Поля таблицы
     id: Mapped[int] = mapped_column(primary_key=True)  # Уникальный идентификатор пользователя в нашей БД (первичный ключ)
-    tg_id = mapped_column(BigInteger)  # Уникальный идентификатор пользователя в Telegram
+    tg_id = mapped_column(BigInteger, unique=True, index=True)  # Уникальный идентификатор пользователя в Telegram
     username: Mapped[str] = mapped_column(String(100), nullable=True)  # Имя пользователя в Telegram (может отсутствовать)
 
 
@@ -28,22 +32,31 @@ class Product(Base):
     photo_id: Mapped[str] = mapped_column(String)  # File ID фотографии товара в Telegram
 
 
-# Модель товара в корзине пользователя
+# Модель товара в корзине пользователя (одна строка на товар, количество хранится в quantity)
 class CartItem(Base):
     __tablename__ = 'cart_items'
+    # Один товар встречается в корзине пользователя только один раз
+    __table_args__ = (Index('uq_cart_items_user_product', 'user_id', 'product_id', unique=True),)
     
     id: Mapped[int] = mapped_column(primary_key=True)  # Уникальный ID записи в корзине
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))  # ID пользователя, которому принадлежит корзина (внешний ключ)
     product_id: Mapped[int] = mapped_column(ForeignKey('products.id'))  # ID добавленного товара (внешний ключ)
+    quantity: Mapped[int] = mapped_column(default=1)  # Количество единиц товара
 
 
 # Модель заказа
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Покрывающий индекс: фильтр по статусу и сумма выручки без чтения строк заказов
+        Index('ix_orders_status_total_amount', 'status', 'total_amount'),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)  # Уникальный ID заказа
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))  # ID пользователя, сделавшего заказ
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), index=True)  # ID пользователя, сделавшего заказ
     status: Mapped[str] = mapped_column(String(50), default='new')  # Статус заказа (например, 'new', 'paid', 'shipped')
+    total_amount: Mapped[float] = mapped_column(Float(asdecimal=True), default=0)  # Сумма заказа (фиксируется при оформлении)
+    item_count: Mapped[int] = mapped_column(default=0)  # Количество единиц товара в заказе
     
     # Детали доставки
     delivery_pickup_point: Mapped[str] = mapped_column(String(255), nullable=True)  # Адрес пункта выдачи
@@ -59,6 +72,68 @@ class OrderItem(Base):
     __tablename__ = 'order_items'
     
     id: Mapped[int] = mapped_column(primary_key=True)  # Уникальный ID
-    order_id: Mapped[int] = mapped_column(ForeignKey('orders.id'))  # ID заказа, к которому относится товар
+    order_id: Mapped[int] = mapped_column(ForeignKey('orders.id'), index=True)  # ID заказа, к которому относится товар
     product_name: Mapped[str] = mapped_column(String(100))  # Название товара на момент заказа
-    product_price: Mapped[float] = mapped_column(Float(asdecimal=True))  # Цена товара на момент заказа
\ No newline at end of file
+    product_price: Mapped[float] = mapped_column(Float(asdecimal=True))  # Цена товара на момент заказа
+    quantity: Mapped[int] = mapped_column(default=1)  # Количество единиц товара
+
+
+# Модель рассылки. Хранит прогресс, чтобы после перезапуска бота рассылка продолжилась, а не началась заново
+class Mailing(Base):
+    __tablename__ = 'mailings'
+
+    id: Mapped[int] = mapped_column(primary_key=True)  # Уникальный ID рассылки
+    text: Mapped[str] = mapped_column(Text)  # Текст сообщения (HTML)
+    status: Mapped[str] = mapped_column(String(20), default='running', index=True)  # 'running' или 'completed'
+    admin_chat_id = mapped_column(BigInteger)  # Чат админа, запустившего рассылку
+    progress_message_id: Mapped[int] = mapped_column(nullable=True)  # Сообщение, в котором показывается прогресс
+    cursor: Mapped[int] = mapped_column(default=0)  # ID последнего обработанного пользователя (users.id)
+    total: Mapped[int] = mapped_column(default=0)  # Количество получателей на момент запуска
+    sent_count: Mapped[int] = mapped_column(default=0)  # Успешно отправлено
+    failed_count: Mapped[int] = mapped_column(default=0)  # Не удалось отправить
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)  # Время запуска
+
+
+# Счетчики статистики магазина (единственная строка с id=1).
+# Поддерживаются в тех же транзакциях, что и изменения пользователей и заказов,
+# поэтому статистика читается одним запросом без агрегатов по всей истории
+class ShopStats(Base):
+    __tablename__ = 'shop_stats'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    total_users: Mapped[int] = mapped_column(default=0)  # Всего пользователей
+    new_orders: Mapped[int] = mapped_column(default=0)  # Заказов по статусам
+    paid_orders: Mapped[int] = mapped_column(default=0)
+    processing_orders: Mapped[int] = mapped_column(default=0)
+    shipped_orders: Mapped[int] = mapped_column(default=0)
+    completed_orders: Mapped[int] = mapped_column(default=0)
+    canceled_orders: Mapped[int] = mapped_column(default=0)
+    total_revenue: Mapped[float] = mapped_column(Float(asdecimal=True), default=0)  # Выручка по завершенным заказам
+
+
+# Сохраненное FSM-состояние (см. fsm_storage.py): переживает перезапуск бота
+class FsmState(Base):
+    __tablename__ = 'fsm_states'
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # Ключ: бот, чат, пользователь и т.д.
+    state: Mapped[str] = mapped_column(String(255), nullable=True)  # Текущее состояние
+    data: Mapped[str] = mapped_column(Text, default='{}')  # Данные состояния в формате JSON
+    updated_at: Mapped[float] = mapped_column(Float, index=True)  # Время последнего изменения (unix time)
+
+
+# Исходящее уведомление (transactional outbox). Записывается в той же транзакции, что и
+# изменение заказа, и отправляется фоновым обработчиком (см. services/outbox.py)
+class OutboxMessage(Base):
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        Index('ix_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)  # Уникальный ID уведомления
+    chat_id = mapped_column(BigInteger)  # Кому отправить
+    text: Mapped[str] = mapped_column(Text)  # Текст сообщения (HTML)
+    reply_markup: Mapped[str] = mapped_column(Text, nullable=True)  # Inline-клавиатура в формате JSON
+    status: Mapped[str] = mapped_column(String(20), default='pending')  # 'pending' или 'failed'
+    attempts: Mapped[int] = mapped_column(default=0)  # Количество неудачных попыток
+    next_attempt_at: Mapped[float] = mapped_column(Float)  # Когда можно пробовать снова (unix time)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)  # Время создания
@@ -0,0 +1,100 @@
+"""
+Подсчет SQL-запросов по областям кода: бюджет запросов для тестов и поиск повторов (N+1).
+
+    track_queries(engine)              # один раз при создании движка
+    with query_budget(3) as log:       # в тесте: не больше 3 запросов и без дублей
+        await feed_update(...)
+
+В продакшене тот же механизм используется выборочно (см. middlewares/query_budget.py):
+пока область не открыта, обработчик события только читает ContextVar.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# С какого числа одинаковых по тексту запросов в одной области подозреваем N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Область выполнила больше запросов, чем разрешено, или повторила один и тот же запрос."""
+
+
+@dataclass
+class QueryLog:
+    """Запросы, выполненные внутри одной области: пары (SQL, параметры)."""
+    statements: list[tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def duplicates(self) -> dict[str, int]:
+        """Полностью одинаковые запросы (тот же SQL с теми же параметрами), выполненные больше одного раза."""
+        counts = Counter(self.statements)
+        return {sql: count for (sql, _), count in counts.items() if count > 1}
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+        """Запросы с одинаковым текстом, выполненные threshold и более раз (типичный признак N+1)."""
+        counts = Counter(sql for sql, _ in self.statements)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+    def report(self) -> str:
+        """Текстовый список запросов для лога или сообщения об ошибке."""
+        lines = [f"SQL-запросов: {self.count}"]
+        for index, (sql, params) in enumerate(self.statements, start=1):
+            lines.append(f"  {index}. {' '.join(sql.split())} {params}")
+        for sql, count in self.duplicates().items():
+            lines.append(f"  Повтор x{count}: {' '.join(sql.split())}")
+        for sql, count in self.repeated().items():
+            lines.append(f"  Возможный N+1 x{count}: {' '.join(sql.split())}")
+        return '\n'.join(lines)
+
+    def assert_budget(self, max_queries: int, allow_duplicates: bool = False):
+        """Проверяет, что запросов не больше max_queries и (если не разрешено) нет полных повторов."""
+        if self.count > max_queries:
+            raise QueryBudgetExceeded(f"Бюджет {max_queries} превышен.\n{self.report()}")
+        if not allow_duplicates and self.duplicates():
+            raise QueryBudgetExceeded(f"Обнаружены повторяющиеся запросы.\n{self.report()}")
+
+
+# Открытые области подсчета в текущем контексте (области могут быть вложенными)
+_active_logs: ContextVar[tuple[QueryLog, ...]] = ContextVar('active_query_logs', default=())
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    logs = _active_logs.get()
+    if logs:
+        entry = (statement, repr(parameters))
+        for log in logs:
+            log.statements.append(entry)
+
+
+def track_queries(engine: AsyncEngine):
+    """Подключает движок к подсчету запросов."""
+    event.listen(engine.sync_engine, 'before_cursor_execute', _record_statement)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryLog]:
+    """Открывает область подсчета: все запросы внутри нее (в том же контексте asyncio) попадут в QueryLog."""
+    log = QueryLog()
+    token = _active_logs.set(_active_logs.get() + (log,))
+    try:
+        yield log
+    finally:
+        _active_logs.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, allow_duplicates: bool = False) -> Iterator[QueryLog]:
+    """Как count_queries, но при выходе проверяет бюджет и выбрасывает QueryBudgetExceeded."""
+    with count_queries() as log:
+        yield log
+    log.assert_budget(max_queries, allow_duplicates)
+
@@ -1,69 +1,106 @@
-from sqlalchemy import select, func, delete, update
+import re
+import time
+
+from sqlalchemy import select, func, delete, update, insert, literal, text, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database.models import User, Product, CartItem, Order, OrderItem
+from app.database.models import User, Product, CartItem, Order, OrderItem, Mailing, ShopStats, OutboxMessage
+from app.database.cache import UserIdentity, identity_cache, catalog_version
 
 
 # --- Функции для работы с пользователями ---
 
-async def get_user(session: AsyncSession, tg_id: int, username: str | None = None):
+async def get_user(session: AsyncSession, tg_id: int, username: str | None = None) -> UserIdentity:
     """
     Находит пользователя по tg_id. Если пользователь не найден, создает нового.
     Если найден, но изменился username, обновляет его.
+    Результат кэшируется в памяти, поэтому повторные обращения не ходят в БД,
+    пока username не изменится.
     """
+    cached = identity_cache.get(tg_id)
+    if cached and cached.username == username:
+        return cached
+
     # Ищем пользователя в БД по его Telegram ID
-    user = await session.scalar(select(User).where(User.tg_id == tg_id))
-    if not user:
-        # Если пользователь не найден, создаем новую запись
-        user = User(tg_id=tg_id, username=username)
-        session.add(user)
-        await session.commit()
-    elif user.username != username:
-        # Если пользователь найден, но его username изменился, обновляем его
-        user.username = username
+    row = (await session.execute(select(User.id, User.username).where(User.tg_id == tg_id))).one_or_none()
+    if row is None:
+        # Если пользователь не найден, создаем новую запись.
+        # ON CONFLICT защищает от гонки, когда два обновления одновременно создают одного пользователя
+        user_id = await session.scalar(
+            sqlite_insert(User).values(tg_id=tg_id, username=username)
+            .on_conflict_do_nothing(index_elements=[User.tg_id])
+            .returning(User.id)
+        )
+        if user_id is None:
+            user_id = await session.scalar(select(User.id).where(User.tg_id == tg_id))
+        else:
+            await _bump_stats(session, total_users=1)  # Пользователь действительно создан
         await session.commit()
-    return user
-
+    else:
+        user_id = row.id
+        if row.username != username:
+            # Если пользователь найден, но его username изменился, обновляем его
+            await session.execute(update(User).where(User.id == user_id).values(username=username))
+            await session.commit()
 
-# --- Функции для работы с товарами (Каталог) ---
+    identity = UserIdentity(id=user_id, tg_id=tg_id, username=username)
+    identity_cache.set(identity)
+    return identity
 
-async def get_products(session: AsyncSession, page: int = 1, page_size: int = 5):
-    """Получает список товаров для определенной страницы (пагинация)."""
-    offset = (page - 1) * page_size  # Рассчитываем смещение
-    query = select(Product).offset(offset).limit(page_size)  # Запрос на выборку товаров с учетом смещения и лимита
-    return await session.scalars(query)
 
+# --- Keyset-пагинация ---
 
-async def count_products(session: AsyncSession):
-    """Подсчитывает общее количество товаров в базе данных."""
-    return await session.scalar(select(func.count(Product.id)))
+async def _paginate(session: AsyncSession, query, key, cursor: int, forward: bool, page_size: int):
+    """
+    Keyset-пагинация по возрастающему ключу (ID) с выдачей от новых записей к старым.
+    Вместо OFFSET фильтрует по курсору (ID крайней записи соседней страницы),
+    поэтому любая страница стоит столько же, сколько первая.
+    Возвращает кортеж: (записи страницы, есть ли страница ближе к началу, есть ли следующая).
+    """
+    if forward:
+        # Следующая страница: записи старше курсора (cursor=0 - самое начало списка)
+        if cursor:
+            query = query.where(key < cursor)
+        query = query.order_by(key.desc())
+    else:
+        # Предыдущая страница: записи новее курсора, выбираем ближайшие и разворачиваем
+        query = query.where(key > cursor).order_by(key.asc())
+
+    # Берем на одну запись больше, чтобы узнать, есть ли еще страница в этом направлении
+    rows = (await session.execute(query.limit(page_size + 1))).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if forward:
+        return rows, bool(cursor), has_more
+    rows.reverse()
+    return rows, has_more, True
 
 
 # --- Функции для работы с корзиной ---
 
 async def add_to_cart(session: AsyncSession, user_id: int, product_id: int):
-    """Добавляет товар в корзину пользователя."""
-    cart_item = CartItem(user_id=user_id, product_id=product_id)
-    session.add(cart_item)
+    """
+    Добавляет товар в корзину пользователя.
+    Если товар уже в корзине, атомарно увеличивает его количество на единицу.
+    """
+    query = sqlite_insert(CartItem).values(user_id=user_id, product_id=product_id, quantity=1) \
+        .on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={'quantity': CartItem.quantity + 1}
+        )
+    await session.execute(query)
     await session.commit()
 
 
 async def get_cart_items(session: AsyncSession, user_id: int):
     """
-    Получает сгруппированный список товаров в корзине пользователя.
+    Получает список товаров в корзине пользователя.
     Для каждого товара возвращает название, цену и количество.
     """
-    query = select(Product.name, Product.price, func.count(CartItem.product_id).label('quantity')) \
+    query = select(Product.name, Product.price, CartItem.quantity) \
         .join(CartItem, Product.id == CartItem.product_id) \
         .where(CartItem.user_id == user_id) \
-        .group_by(Product.name, Product.price)  # Группируем, чтобы посчитать одинаковые товары
-    return await session.execute(query)
-
-
-async def get_cart_items_for_order(session: AsyncSession, user_id: int):
-    """Получает полный (несгруппированный) список товаров из корзины для создания заказа."""
-    query = select(Product.name, Product.price) \
-        .join(CartItem, Product.id == CartItem.product_id) \
-        .where(CartItem.user_id == user_id)
+        .order_by(CartItem.id)
     return await session.execute(query)
 
 
@@ -77,15 +114,10 @@ async def clear_cart(session: AsyncSession, user_id: int):
 
 async def place_order(session: AsyncSession, user_id: int, delivery_details: dict):
     """
-    Создает новый заказ на основе товаров в корзине и данных о доставке.
+    Создает заказ из корзины одной транзакцией: запись заказа, перенос товаров корзины
+    в order_items одним INSERT ... SELECT, сохранение суммы заказа и очистка корзины.
+    Возвращает кортеж (ID заказа, сумма заказа, товары заказа) или None, если корзина пуста.
     """
-    # Получаем товары из корзины
-    cart_products = await get_cart_items_for_order(session, user_id)
-    products_list = cart_products.all()
-
-    if not products_list:
-        return None  # Нельзя создать заказ из пустой корзины
-
     # Создаем основную запись о заказе
     new_order = Order(
         user_id=user_id,
@@ -97,29 +129,43 @@ async def place_order(session: AsyncSession, user_id: int, delivery_details: dic
     session.add(new_order)
     await session.flush()  # Получаем ID нового заказа до коммита
 
-    # Добавляем каждый товар из корзины в детали заказа (OrderItem)
-    for product in products_list:
-        order_item = OrderItem(
-            order_id=new_order.id,
-            product_name=product.name,
-            product_price=product.price
-        )
-        session.add(order_item)
+    # Переносим товары из корзины в детали заказа одним запросом (с фиксацией текущих названий и цен)
+    cart_query = select(literal(new_order.id), Product.name, Product.price, CartItem.quantity) \
+        .join(CartItem, Product.id == CartItem.product_id) \
+        .where(CartItem.user_id == user_id) \
+        .order_by(CartItem.id)
+    items = (await session.execute(
+        insert(OrderItem)
+        .from_select(['order_id', 'product_name', 'product_price', 'quantity'], cart_query)
+        .returning(OrderItem.product_name, OrderItem.product_price, OrderItem.quantity)
+    )).all()
+
+    if not items:
+        await session.rollback()
+        return None  # Нельзя создать заказ из пустой корзины
+
+    # Фиксируем сумму и количество товаров в самом заказе
+    total = sum(item.product_price * item.quantity for item in items)
+    new_order.total_amount = total
+    new_order.item_count = sum(item.quantity for item in items)
 
+    await session.execute(delete(CartItem).where(CartItem.user_id == user_id))
+    await _bump_stats(session, new_orders=1)
     await session.commit()
-    return new_order.id  # Возвращаем ID созданного заказа
+    return new_order.id, total, items
 
 
-async def get_user_orders(session: AsyncSession, user_id: int):
-    """Получает историю заказов конкретного пользователя."""
-    query = select(Order.id, Order.status).where(Order.user_id == user_id).order_by(Order.id.desc())
-    return await session.execute(query)
+async def get_user_orders(session: AsyncSession, user_id: int, cursor: int = 0, forward: bool = True,
+                          page_size: int = 10):
+    """Получает страницу истории заказов конкретного пользователя (от новых к старым)."""
+    query = select(Order.id, Order.status, Order.total_amount).where(Order.user_id == user_id)
+    return await _paginate(session, query, Order.id, cursor, forward, page_size)
 
 
-async def get_all_orders(session: AsyncSession):
-    """Получает все заказы для админ-панели."""
-    query = select(Order.id, Order.status, User.tg_id).join(User, Order.user_id == User.id).order_by(Order.id.desc())
-    return await session.execute(query)
+async def get_all_orders(session: AsyncSession, cursor: int = 0, forward: bool = True, page_size: int = 10):
+    """Получает страницу списка всех заказов для админ-панели (от новых к старым)."""
+    query = select(Order.id, Order.status, Order.total_amount, User.tg_id).join(User, Order.user_id == User.id)
+    return await _paginate(session, query, Order.id, cursor, forward, page_size)
 
 
 async def get_order_details(session: AsyncSession, order_id: int):
@@ -129,13 +175,14 @@ async def get_order_details(session: AsyncSession, order_id: int):
         Order.id, Order.status, Order.delivery_pickup_point,
         Order.recipient_full_name, Order.recipient_phone_number,
         Order.receipt_file_id, Order.cdek_track_number,
+        Order.total_amount, Order.item_count,
         User.tg_id, User.username
     ).join(User, Order.user_id == User.id).where(Order.id == order_id)
     
     order_info = await session.execute(query)
     
     # Запрос на получение списка товаров в этом заказе
-    query_items = select(OrderItem.product_name, OrderItem.product_price) \
+    query_items = select(OrderItem.product_name, OrderItem.product_price, OrderItem.quantity) \
         .where(OrderItem.order_id == order_id)
     order_items = await session.execute(query_items)
     
@@ -151,16 +198,55 @@ async def get_user_order_details(session: AsyncSession, order_id: int, user_id:
     if not order:
         return None, None
         
-    query_items = select(OrderItem.product_name, OrderItem.product_price).where(OrderItem.order_id == order_id)
+    query_items = select(OrderItem.product_name, OrderItem.product_price, OrderItem.quantity).where(OrderItem.order_id == order_id)
     order_items = await session.execute(query_items)
     
     return order, order_items.all()
 
 
-async def update_order_status(session: AsyncSession, order_id: int, status: str):
-    """Обновляет статус заказа."""
-    query = update(Order).where(Order.id == order_id).values(status=status)
-    await session.execute(query)
+async def update_order_status(session: AsyncSession, order_id: int, status: str,
+                              notification: str | None = None, reply_markup=None,
+                              cdek_track_number: str | None = None):
+    """
+    Обновляет статус заказа и в той же транзакции переносит заказ
+    между счетчиками статистики (а при завершении - учитывает выручку).
+    Если передан текст notification, в той же транзакции ставит уведомление покупателю в outbox.
+    Если передан cdek_track_number, трек-номер сохраняется в той же транзакции.
+    """
+    if cdek_track_number is not None:
+        await session.execute(
+            update(Order).where(Order.id == order_id).values(cdek_track_number=cdek_track_number)
+        )
+    while True:
+        order = (await session.execute(
+            select(Order.status, Order.total_amount).where(Order.id == order_id)
+        )).one_or_none()
+        if order is None:
+            return
+        old_status = order.status
+        if old_status == status:
+            if notification:
+                await _enqueue_order_notification(session, order_id, notification, reply_markup)
+            if notification or cdek_track_number is not None:
+                await session.commit()
+            return
+        # Меняем статус, только если его никто не успел изменить после чтения
+        result = await session.execute(
+            update(Order).where(Order.id == order_id, Order.status == old_status).values(status=status)
+        )
+        if result.rowcount:
+            break
+
+    deltas = {}
+    if hasattr(ShopStats, f'{old_status}_orders'):
+        deltas[f'{old_status}_orders'] = -1
+    if hasattr(ShopStats, f'{status}_orders'):
+        deltas[f'{status}_orders'] = 1
+    if 'completed' in (old_status, status):
+        deltas['total_revenue'] = order.total_amount if status == 'completed' else -order.total_amount
+    await _bump_stats(session, **deltas)
+    if notification:
+        await _enqueue_order_notification(session, order_id, notification, reply_markup)
     await session.commit()
 
 
@@ -171,30 +257,59 @@ async def attach_receipt_to_order(session: AsyncSession, order_id: int, file_id:
     await session.commit()
 
 
-async def set_cdek_track_number(session: AsyncSession, order_id: int, track_number: str):
-    """Устанавливает трек-номер для заказа."""
-    query = update(Order).where(Order.id == order_id).values(cdek_track_number=track_number)
-    await session.execute(query)
-    await session.commit()
-
 # --- Функции для отчета и статистики ---
 
-async def get_all_orders_with_user_info(session: AsyncSession):
-    """Получает все заказы с информацией о пользователе для Excel-отчета."""
-    query = select(Order, User).join(User, Order.user_id == User.id).order_by(Order.id.asc())
-    result = await session.execute(query)
-    return result.all()
+async def get_orders_for_report(session: AsyncSession, after_id: int, limit: int):
+    """Получает порцию заказов (ID больше after_id) с информацией о пользователе для Excel-отчета."""
+    query = select(
+        Order.id, Order.status, Order.delivery_pickup_point,
+        Order.recipient_full_name, Order.recipient_phone_number, Order.cdek_track_number,
+        Order.total_amount, User.tg_id, User.username
+    ).join(User, Order.user_id == User.id).where(Order.id > after_id).order_by(Order.id).limit(limit)
+    return (await session.execute(query)).all()
+
+
+async def get_items_for_orders(session: AsyncSession, order_ids: list[int]):
+    """Получает товары указанных заказов для отчета."""
+    query = select(OrderItem.order_id, OrderItem.product_name, OrderItem.product_price, OrderItem.quantity) \
+        .where(OrderItem.order_id.in_(order_ids)) \
+        .order_by(OrderItem.id)
+    return (await session.execute(query)).all()
 
 
-async def get_all_order_items(session: AsyncSession):
-    """Получает все заказанные товары для отчета."""
-    query = select(OrderItem)
-    result = await session.scalars(query)
-    return result.all()
+async def _bump_stats(session: AsyncSession, **deltas):
+    """Изменяет счетчики статистики на указанные величины (без коммита - в транзакции вызывающего)."""
+    if not deltas:
+        return
+    values = {name: getattr(ShopStats, name) + delta for name, delta in deltas.items()}
+    await session.execute(update(ShopStats).where(ShopStats.id == 1).values(**values))
 
 
 async def get_stats(session: AsyncSession):
-    """Собирает статистику по магазину."""
+    """Получает статистику по магазину из таблицы счетчиков (один запрос)."""
+    stats_row = await session.get(ShopStats, 1)
+    if stats_row is None:
+        return await rebuild_stats(session)
+
+    stats = {
+        'total_users': stats_row.total_users,
+        'new_orders': stats_row.new_orders,
+        'paid_orders': stats_row.paid_orders,
+        'processing_orders': stats_row.processing_orders,
+        'shipped_orders': stats_row.shipped_orders,
+        'completed_orders': stats_row.completed_orders,
+        'canceled_orders': stats_row.canceled_orders,
+        'total_revenue': int(stats_row.total_revenue or 0)
+    }
+    stats['total_orders'] = sum(value for key, value in stats.items() if key.endswith('_orders'))
+    return stats
+
+
+async def rebuild_stats(session: AsyncSession):
+    """
+    Пересчитывает счетчики статистики по всей истории и сохраняет их.
+    Используется для проверки согласованности (команда /rebuild_stats).
+    """
     # Общее количество пользователей
     total_users = await session.scalar(select(func.count(User.id)))
     
@@ -203,34 +318,22 @@ async def get_stats(session: AsyncSession):
         select(Order.status, func.count(Order.id)).group_by(Order.status)
     )
     
-    # Общая выручка по завершенным заказам
+    # Общая выручка по завершенным заказам (по индексу ix_orders_status_total_amount)
     total_revenue = await session.scalar(
-        select(func.sum(OrderItem.product_price))
-        .join(Order, OrderItem.order_id == Order.id)
-        .where(Order.status == 'completed')
+        select(func.sum(Order.total_amount)).where(Order.status == 'completed')
     )
 
-    # Формируем словарь со статистикой
-    stats = {
-        'total_users': total_users or 0,
-        'total_orders': 0,
-        'new_orders': 0,
-        'paid_orders': 0,
-        'processing_orders': 0,
-        'shipped_orders': 0,
-        'completed_orders': 0,
-        'canceled_orders': 0,
-        'total_revenue': int(total_revenue) if total_revenue else 0
-    }
-
-    # Заполняем статистику по статусам
+    stats_row = await session.get(ShopStats, 1) or ShopStats(id=1)
+    stats_row.total_users = total_users or 0
+    stats_row.total_revenue = total_revenue or 0
+    for status in ('new', 'paid', 'processing', 'shipped', 'completed', 'canceled'):
+        setattr(stats_row, f'{status}_orders', 0)
     for status, count in orders_by_status:
-        stats_key = f'{status}_orders'
-        if stats_key in stats:
-            stats[stats_key] = count
-            stats['total_orders'] += count
-        
-    return stats
+        if hasattr(ShopStats, f'{status}_orders'):
+            setattr(stats_row, f'{status}_orders', count)
+    session.add(stats_row)
+    await session.commit()
+    return await get_stats(session)
 
 
 # --- Функции для администрирования (товары, рассылка) ---
@@ -239,36 +342,235 @@ async def add_product(session: AsyncSession, name: str, price: float, photo_id:
     """Добавляет новый товар в базу данных."""
     product = Product(name=name, price=price, photo_id=photo_id, description=description)
     session.add(product)
+    await session.flush()  # Получаем ID товара для поискового индекса
+    await _index_product(session, product.id)
+    await session.commit()
+    catalog_version.bump()  # Сбрасываем закэшированный каталог
+
+
+async def add_products(session: AsyncSession, products: list[dict]) -> list[int]:
+    """
+    Добавляет порцию товаров (словари с name, price, photo_id, description) одной транзакцией
+    вместе с записями поискового индекса. Возвращает ID добавленных товаров.
+    """
+    product_ids = list(await session.scalars(insert(Product).returning(Product.id), products))
+    await session.execute(
+        text(f"INSERT INTO products_fts (rowid, name, description) {_SEARCH_INDEX_SELECT} WHERE id IN :ids")
+        .bindparams(bindparam('ids', expanding=True)),
+        {'ids': product_ids}
+    )
     await session.commit()
+    catalog_version.bump()  # Сбрасываем закэшированный каталог
+    return product_ids
 
 
 async def get_all_products(session: AsyncSession):
     """Получает все товары (для управления ими в админ-панели)."""
-    return await session.scalars(select(Product))
+    return await session.scalars(select(Product).order_by(Product.id))
 
 
 async def update_product_price(session: AsyncSession, product_id: int, new_price: float):
     """Обновляет цену товара."""
     await session.execute(update(Product).where(Product.id == product_id).values(price=new_price))
     await session.commit()
+    catalog_version.bump(product_id)  # Сбрасываем закэшированный каталог и карточку товара
 
 
 async def update_product_name(session: AsyncSession, product_id: int, new_name: str):
     """Обновляет название товара."""
     await session.execute(update(Product).where(Product.id == product_id).values(name=new_name))
+    await _index_product(session, product_id)
     await session.commit()
+    catalog_version.bump(product_id)  # Сбрасываем закэшированный каталог и карточку товара
 
 async def update_product_description(session: AsyncSession, product_id: int, new_description: str | None):
     """Обновляет описание товара."""
     await session.execute(update(Product).where(Product.id == product_id).values(description=new_description))
+    await _index_product(session, product_id)
     await session.commit()
+    catalog_version.bump(product_id)  # Сбрасываем закэшированный каталог и карточку товара
 
 async def delete_product(session: AsyncSession, product_id: int):
     """Удаляет товар из базы данных."""
     await session.execute(delete(Product).where(Product.id == product_id))
+    await session.execute(text("DELETE FROM products_fts WHERE rowid = :id"), {'id': product_id})
+    await session.commit()
+    catalog_version.bump(product_id)  # Сбрасываем закэшированный каталог и карточку товара
+
+
+# --- Полнотекстовый поиск по товарам (FTS5-таблица products_fts, rowid = ID товара) ---
+
+# Выборка товаров для индекса: ё заменяется на е, чтобы поиск не зависел от их написания
+_SEARCH_INDEX_SELECT = """
+    SELECT id,
+           replace(replace(name, 'ё', 'е'), 'Ё', 'Е'),
+           replace(replace(COALESCE(description, ''), 'ё', 'е'), 'Ё', 'Е')
+    FROM products
+"""
+
+
+async def _index_product(session: AsyncSession, product_id: int):
+    """Обновляет запись товара в поисковом индексе (в текущей транзакции, без коммита)."""
+    await session.execute(text("DELETE FROM products_fts WHERE rowid = :id"), {'id': product_id})
+    await session.execute(
+        text(f"INSERT INTO products_fts (rowid, name, description) {_SEARCH_INDEX_SELECT} WHERE id = :id"),
+        {'id': product_id}
+    )
+
+
+def normalize_search_query(query: str) -> str:
+    """
+    Приводит поисковый запрос к виду, в котором он ищется: слова в нижнем регистре через пробел, ё заменена на е.
+    Спецсимволы FTS5 отбрасываются. Одинаково найденные запросы дают одинаковую строку (ключ для кэшей).
+    """
+    return ' '.join(re.findall(r'\w+', query.lower().replace('ё', 'е')))
+
+
+def _search_match_expression(query: str) -> str | None:
+    """Превращает текст пользователя в выражение MATCH: каждое слово ищется как префикс, все слова должны встретиться."""
+    words = normalize_search_query(query).split()
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+async def search_products(session: AsyncSession, query: str, offset: int = 0, page_size: int = 5):
+    """
+    Ищет товары по названию и описанию, лучшие совпадения (bm25) первыми.
+    Возвращает кортеж: (товары страницы, есть ли предыдущая страница, есть ли следующая).
+    """
+    match = _search_match_expression(query)
+    if match is None:
+        return [], False, False
+    # У сортировки по релевантности нет keyset-курсора, поэтому страницы листаются через OFFSET
+    # (по запросу обычно находится немного товаров). Берем на одну запись больше, чтобы узнать о следующей странице
+    rows = (await session.execute(
+        text("""
+            SELECT products.id, products.name, products.price
+            FROM products_fts JOIN products ON products.id = products_fts.rowid
+            WHERE products_fts MATCH :match
+            ORDER BY bm25(products_fts, 10.0, 1.0), products.id
+            LIMIT :limit OFFSET :offset
+        """),
+        {'match': match, 'limit': page_size + 1, 'offset': offset}
+    )).all()
+    return rows[:page_size], offset > 0, len(rows) > page_size
+
+
+async def rebuild_search_index(session: AsyncSession) -> int:
+    """Полностью перестраивает поисковый индекс по таблице товаров. Возвращает количество товаров в индексе."""
+    await session.execute(text("DELETE FROM products_fts"))
+    await session.execute(text(f"INSERT INTO products_fts (rowid, name, description) {_SEARCH_INDEX_SELECT}"))
+    await session.execute(text("INSERT INTO products_fts (products_fts) VALUES ('optimize')"))
+    await session.commit()
+    catalog_version.bump()  # Результаты поиска, закэшированные по старому индексу, больше не действительны
+    return await session.scalar(text("SELECT count(*) FROM products_fts"))
+
+
+async def get_users_batch(session: AsyncSession, after_id: int, limit: int):
+    """Получает очередную порцию пользователей (ID в БД и Telegram ID) с ID больше after_id."""
+    query = select(User.id, User.tg_id).where(User.id > after_id).order_by(User.id).limit(limit)
+    return (await session.execute(query)).all()
+
+
+async def create_mailing(session: AsyncSession, text: str, admin_chat_id: int, progress_message_id: int | None):
+    """Создает запись о новой рассылке и возвращает ее ID."""
+    total = await session.scalar(select(func.count(User.id)))
+    mailing = Mailing(
+        text=text,
+        status='running',
+        admin_chat_id=admin_chat_id,
+        progress_message_id=progress_message_id,
+        cursor=0,
+        total=total or 0,
+        sent_count=0,
+        failed_count=0
+    )
+    session.add(mailing)
+    await session.commit()
+    return mailing.id
+
+
+async def get_mailing(session: AsyncSession, mailing_id: int):
+    """Получает рассылку по ID."""
+    return await session.get(Mailing, mailing_id)
+
+
+async def get_running_mailing_ids(session: AsyncSession):
+    """Получает ID незавершенных рассылок (для продолжения после перезапуска)."""
+    return (await session.scalars(select(Mailing.id).where(Mailing.status == 'running').order_by(Mailing.id))).all()
+
+
+async def save_mailing_progress(session: AsyncSession, mailing_id: int, cursor: int, sent: int, failed: int,
+                                completed: bool = False):
+    """Сохраняет прогресс рассылки: курсор и прибавку к счетчикам отправленных и неудачных сообщений."""
+    values = {
+        'cursor': cursor,
+        'sent_count': Mailing.sent_count + sent,
+        'failed_count': Mailing.failed_count + failed
+    }
+    if completed:
+        values['status'] = 'completed'
+    await session.execute(update(Mailing).where(Mailing.id == mailing_id).values(**values))
     await session.commit()
 
 
-async def get_all_user_ids(session: AsyncSession):
-    """Получает Telegram ID всех пользователей для рассылки."""
-    return await session.scalars(select(User.tg_id))
\ No newline at end of file
+# --- Очередь уведомлений (outbox) ---
+
+def enqueue_notification(session: AsyncSession, chat_id: int, text: str, reply_markup=None):
+    """
+    Добавляет уведомление в outbox в текущей транзакции (без commit):
+    оно будет сохранено вместе с остальными изменениями и отправлено фоновым обработчиком.
+    """
+    session.add(OutboxMessage(
+        chat_id=chat_id,
+        text=text,
+        reply_markup=reply_markup.model_dump_json(exclude_none=True) if reply_markup else None,
+        status='pending',
+        attempts=0,
+        next_attempt_at=time.time()
+    ))
+
+
+async def _enqueue_order_notification(session: AsyncSession, order_id: int, text: str, reply_markup=None):
+    """Ставит в outbox уведомление покупателю, оформившему заказ."""
+    tg_id = await session.scalar(select(User.tg_id).join(Order, Order.user_id == User.id).where(Order.id == order_id))
+    if tg_id is not None:
+        enqueue_notification(session, tg_id, text, reply_markup)
+
+
+async def get_due_notifications(session: AsyncSession, limit: int):
+    """Получает порцию уведомлений, которые пора отправить (старые - первыми)."""
+    query = select(OutboxMessage) \
+        .where(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= time.time()) \
+        .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id) \
+        .limit(limit)
+    return (await session.scalars(query)).all()
+
+
+async def get_next_notification_time(session: AsyncSession):
+    """Возвращает время ближайшей запланированной попытки отправки (или None, если очередь пуста)."""
+    return await session.scalar(
+        select(func.min(OutboxMessage.next_attempt_at)).where(OutboxMessage.status == 'pending')
+    )
+
+
+async def save_notification_results(session: AsyncSession, sent_ids: list[int], retries: dict[int, float],
+                                    failed_ids: list[int]):
+    """
+    Сохраняет результат обработки порции одной транзакцией: отправленные удаляет,
+    для повторных попыток записывает время следующей попытки, безнадежные помечает как 'failed'.
+    """
+    if sent_ids:
+        await session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(sent_ids)))
+    for message_id, next_attempt_at in retries.items():
+        await session.execute(
+            update(OutboxMessage).where(OutboxMessage.id == message_id)
+            .values(attempts=OutboxMessage.attempts + 1, next_attempt_at=next_attempt_at)
+        )
+    if failed_ids:
+        await session.execute(
+            update(OutboxMessage).where(OutboxMessage.id.in_(failed_ids))
+            .values(status='failed', attempts=OutboxMessage.attempts + 1)
+        )
+    await session.commit()
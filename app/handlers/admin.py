@@ -1,8 +1,11 @@
-import asyncio
+import html
 import logging
+import os
+import tempfile
 from datetime import datetime
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,10 +16,13 @@ from app.lexicon.lexicon_ru import LEXICON, ORDER_STATUSES
 from app.keyboards import builders as kb
 from app.keyboards.builders import (
     ViewOrder, ChangeStatus, ManageProduct, EditProduct,
-    DeleteProduct, CancelFSM, ViewReceipt, PromptStatus
+    DeleteProduct, CancelFSM, ViewReceipt, PromptStatus, OrdersPage
 )
 from app.database import requests as rq
 from app.services.report_generator import create_orders_excel_report
+from app.services.product_import import import_products, ImportFormatError
+from app.services.broadcast import Broadcaster
+from app.services.outbox import OutboxWorker
 
 # Создаем роутер для админских обработчиков
 router = Router()
@@ -56,6 +62,10 @@ class EditProductState(StatesGroup):
 class Mailing(StatesGroup):
     waiting_for_text = State()
 
+# Состояние для импорта товаров из файла
+class ImportProducts(StatesGroup):
+    waiting_for_file = State()
+
 
 # --- Сервисная функция для отправки деталей заказа ---
 async def send_order_details(message: Message, bot: Bot, session: AsyncSession, order_id: int):
@@ -76,9 +86,11 @@ async def send_order_details(message: Message, bot: Bot, session: AsyncSession,
         return
 
     # Формируем список товаров в заказе
-    products_text = "\n".join([f"  - {item.product_name} ({int(item.product_price)} руб.)" for item in order_items])
-    total_price = sum(item.product_price for item in order_items)
-    products_text += f"\n\n<b>Итого: {int(total_price)} руб.</b>"
+    products_text = "\n".join([
+        f"  - {item.product_name} x{item.quantity} ({int(item.product_price * item.quantity)} руб.)"
+        for item in order_items
+    ])
+    products_text += f"\n\n<b>Итого: {int(order_info.total_amount)} руб.</b>"
 
     # Формируем основной текст сообщения
     text = LEXICON['admin_order_details'].format(
@@ -211,13 +223,65 @@ async def add_product_description(message: Message, state: FSMContext, session:
     )
 
 
+# --- Импорт товаров из файла ---
+
+# Максимальный размер файла, который бот может скачать через Bot API
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+
+@router.message(Command('import_products'))
+async def import_products_start(message: Message, state: FSMContext):
+    """Запрашивает файл с товарами для массового добавления."""
+    await state.set_state(ImportProducts.waiting_for_file)
+    await message.answer(LEXICON['import_products_prompt'], reply_markup=kb.cancel_fsm_keyboard())
+
+
+@router.message(ImportProducts.waiting_for_file, F.document)
+async def import_products_file(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
+    """Скачивает файл во временный каталог, импортирует товары и отправляет итог."""
+    extension = os.path.splitext(message.document.file_name or '')[1].lower().lstrip('.')
+    if extension not in ('csv', 'xlsx'):
+        await message.answer(LEXICON['import_products_unsupported'], reply_markup=kb.cancel_fsm_keyboard())
+        return
+    if (message.document.file_size or 0) > MAX_IMPORT_FILE_SIZE:
+        await message.answer(LEXICON['import_products_too_large'], reply_markup=kb.cancel_fsm_keyboard())
+        return
+
+    await state.clear()
+    await message.answer(LEXICON['import_products_started'])
+    with tempfile.TemporaryDirectory(prefix='products_import_') as tmp_dir:
+        # Файл скачивается на диск потоком, а не в память
+        path = os.path.join(tmp_dir, f'import.{extension}')
+        await bot.download(message.document, destination=path)
+        try:
+            result = await import_products(session, path, extension)
+        except ImportFormatError as e:
+            if e.accepted:
+                text = LEXICON['import_products_failed_partial'].format(reason=html.escape(str(e)), accepted=e.accepted)
+            else:
+                text = LEXICON['import_products_failed'].format(reason=html.escape(str(e)))
+            await message.answer(text, reply_markup=kb.admin_panel_keyboard())
+            return
+
+    text = LEXICON['import_products_done'].format(accepted=result.accepted, rejected=result.rejected)
+    if result.errors:
+        text += LEXICON['import_products_errors'].format(
+            count=len(result.errors),
+            errors=html.escape('\n'.join(result.errors))
+        )
+    await message.answer(text, reply_markup=kb.admin_panel_keyboard())
+
+
 # --- Управление заказами ---
 
 @router.callback_query(F.data == 'admin_list_orders')
-async def list_orders(callback: CallbackQuery | Message, session: AsyncSession):
-    """Отображает список всех заказов для админа."""
-    orders = await rq.get_all_orders(session)
-    orders_list = orders.all()
+@router.callback_query(OrdersPage.filter())
+async def list_orders(callback: CallbackQuery | Message, session: AsyncSession, callback_data: OrdersPage | None = None):
+    """Отображает список заказов для админа (постранично, от новых к старым)."""
+    callback_data = callback_data or OrdersPage()  # Кнопка 'Список заказов' открывает самые новые заказы
+    orders_list, has_prev, has_next = await rq.get_all_orders(
+        session, cursor=callback_data.cursor, forward=callback_data.forward
+    )
 
     sender = callback.message if isinstance(callback, CallbackQuery) else callback
 
@@ -227,7 +291,7 @@ async def list_orders(callback: CallbackQuery | Message, session: AsyncSession):
             markup = kb.admin_panel_keyboard()
         else:
             text = LEXICON['admin_list_orders_title']
-            markup = kb.admin_list_orders_keyboard(orders_list)
+            markup = kb.admin_list_orders_keyboard(orders_list, has_prev, has_next)
 
         if isinstance(callback, CallbackQuery):
             await sender.edit_text(text, reply_markup=markup)
@@ -315,7 +379,8 @@ async def prompt_cdek_track_number(callback: CallbackQuery, callback_data: Chang
 
 
 @router.callback_query(ChangeStatus.filter(F.action.is_(None)))
-async def change_order_status(callback: CallbackQuery, callback_data: ChangeStatus, session: AsyncSession, bot: Bot):
+async def change_order_status(callback: CallbackQuery, callback_data: ChangeStatus, session: AsyncSession, bot: Bot,
+                              outbox: OutboxWorker):
     """
     Изменяет статус заказа (для статусов, не требующих доп. ввода).
     Например, 'В работе' или 'Завершен'.
@@ -323,10 +388,6 @@ async def change_order_status(callback: CallbackQuery, callback_data: ChangeStat
     order_id = callback_data.order_id
     new_status = callback_data.new_status
 
-    await rq.update_order_status(session, order_id, new_status)
-
-    order_info, _ = await rq.get_order_details(session, order_id)
-
     # Определяем текст уведомления для пользователя
     notification_text = ""
     if new_status == 'processing':
@@ -336,11 +397,10 @@ async def change_order_status(callback: CallbackQuery, callback_data: ChangeStat
             order_id=order_id,
             status=ORDER_STATUSES.get(new_status, new_status)
         )
-    
-    try:
-        await bot.send_message(chat_id=order_info.tg_id, text=notification_text)
-    except Exception as e:
-        logging.error(f"Не удалось отправить уведомление пользователю {order_info.tg_id}: {e}")
+
+    # Уведомление сохраняется в outbox вместе со статусом и отправляется в фоне
+    await rq.update_order_status(session, order_id, new_status, notification=notification_text)
+    outbox.wake()
 
     await callback.answer(LEXICON['admin_status_updated'])
     
@@ -349,7 +409,7 @@ async def change_order_status(callback: CallbackQuery, callback_data: ChangeStat
 
 
 @router.message(CancelOrder.waiting_for_reason, F.text)
-async def process_cancellation_reason(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
+async def process_cancellation_reason(message: Message, state: FSMContext, session: AsyncSession, outbox: OutboxWorker):
     """Обрабатывает введенную причину отмены, меняет статус и уведомляет пользователя."""
     reason = message.text
     data = await state.get_data()
@@ -357,26 +417,19 @@ async def process_cancellation_reason(message: Message, state: FSMContext, sessi
     await state.clear()
 
     if order_id:
-        await rq.update_order_status(session, order_id, 'canceled')
-        order_info, _ = await rq.get_order_details(session, order_id)
-        
-        try:
-            await bot.send_message(
-                chat_id=order_info.tg_id,
-                text=LEXICON['user_order_canceled_with_reason'].format(
-                    order_id=order_id,
-                    reason=reason
-                )
-            )
-        except Exception as e:
-            logging.error(f"Не удалось отправить уведомление об отмене пользователю {order_info.tg_id}: {e}")
+        await rq.update_order_status(
+            session, order_id, 'canceled',
+            notification=LEXICON['user_order_canceled_with_reason'].format(order_id=order_id, reason=reason)
+        )
+        outbox.wake()
     
     await message.answer(LEXICON['admin_status_updated'])
     await list_orders(message, session)  # Возвращаемся к списку заказов
 
 
 @router.message(ShipOrder.waiting_for_track_number, F.text)
-async def process_cdek_track_number(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
+async def process_cdek_track_number(message: Message, state: FSMContext, session: AsyncSession, bot: Bot,
+                                    outbox: OutboxWorker):
     """Обрабатывает введенный трек-номер, меняет статус и уведомляет пользователя."""
     track_number = message.text
     data = await state.get_data()
@@ -384,22 +437,16 @@ async def process_cdek_track_number(message: Message, state: FSMContext, session
     await state.clear()
 
     if order_id:
-        await rq.set_cdek_track_number(session, order_id, track_number)
-        await rq.update_order_status(session, order_id, 'shipped')
-        
-        order_info, _ = await rq.get_order_details(session, order_id)
-        
-        try:
-            await bot.send_message(
-                chat_id=order_info.tg_id,
-                text=LEXICON['user_order_shipped_notification'].format(
-                    order_id=order_id,
-                    track_number=track_number
-                ),
-                reply_markup=kb.shipped_order_notification_keyboard(track_number)
-            )
-        except Exception as e:
-            logging.error(f"Не удалось отправить уведомление об отправке пользователю {order_info.tg_id}: {e}")
+        await rq.update_order_status(
+            session, order_id, 'shipped',
+            cdek_track_number=track_number,
+            notification=LEXICON['user_order_shipped_notification'].format(
+                order_id=order_id,
+                track_number=track_number
+            ),
+            reply_markup=kb.shipped_order_notification_keyboard(track_number)
+        )
+        outbox.wake()
             
         await message.answer(LEXICON['admin_status_updated'])
         await send_order_details(message, bot, session, order_id) # Возвращаемся к деталям заказа
@@ -415,9 +462,9 @@ async def download_report(callback: CallbackQuery, session: AsyncSession, bot: B
     except TelegramBadRequest:
         await callback.answer(LEXICON['generating_report'])
 
-    orders_with_users = await rq.get_all_orders_with_user_info(session)
-    
-    if not orders_with_users:
+    report_path = await create_orders_excel_report(session)
+
+    if report_path is None:
         await callback.message.edit_text(
             LEXICON['report_no_orders'],
             reply_markup=kb.admin_panel_keyboard()
@@ -425,18 +472,15 @@ async def download_report(callback: CallbackQuery, session: AsyncSession, bot: B
         await callback.answer()
         return
 
-    all_items = await rq.get_all_order_items(session)
-    
-    report_file_bytes = create_orders_excel_report(orders_with_users, all_items)
-    
     filename = f"orders_report_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
-    file_to_send = BufferedInputFile(report_file_bytes.getvalue(), filename=filename)
-
-    await bot.send_document(
-        chat_id=callback.from_user.id,
-        document=file_to_send,
-        caption=LEXICON['report_ready']
-    )
+    try:
+        await bot.send_document(
+            chat_id=callback.from_user.id,
+            document=FSInputFile(report_path, filename=filename),
+            caption=LEXICON['report_ready']
+        )
+    finally:
+        os.remove(report_path)  # Отчет больше не нужен, удаляем временный файл
     
     # Возвращаем админа в главное меню админки
     try:
@@ -466,6 +510,26 @@ async def get_statistics(callback: CallbackQuery, session: AsyncSession):
             await callback.answer("Произошла ошибка при обновлении статистики.")
 
 
+@router.message(Command('rebuild_stats'))
+async def cmd_rebuild_stats(message: Message, session: AsyncSession):
+    """Пересчитывает счетчики статистики по всей истории (проверка согласованности)."""
+    stats = await rq.rebuild_stats(session)
+    await message.answer(
+        text=LEXICON['stats_rebuilt'] + '\n\n' + LEXICON['stats_message'].format(**stats),
+        reply_markup=kb.admin_panel_keyboard()
+    )
+
+
+@router.message(Command('rebuild_search'))
+async def cmd_rebuild_search(message: Message, session: AsyncSession):
+    """Перестраивает поисковый индекс товаров (если он разошелся с таблицей товаров)."""
+    count = await rq.rebuild_search_index(session)
+    await message.answer(
+        text=LEXICON['search_index_rebuilt'].format(count=count),
+        reply_markup=kb.admin_panel_keyboard()
+    )
+
+
 # --- Управление товарами ---
 
 @router.callback_query(F.data == 'admin_manage_products')
@@ -645,20 +709,15 @@ async def start_mailing(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(Mailing.waiting_for_text, F.text)
-async def process_mailing_text(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
-    """Обрабатывает текст для рассылки и отправляет его всем пользователям."""
+async def process_mailing_text(message: Message, state: FSMContext, session: AsyncSession, broadcaster: Broadcaster):
+    """
+    Обрабатывает текст для рассылки и запускает ее в фоне.
+    Прогресс отображается в отдельном сообщении, которое обновляется по ходу рассылки.
+    """
     await state.clear()
-    await message.answer(LEXICON['mailing_started'])
+    progress_message = await message.answer(LEXICON['mailing_started'])
 
-    user_ids = await rq.get_all_user_ids(session)
-    sent_count = 0
-    for user_id in user_ids:
-        try:
-            await bot.send_message(chat_id=user_id, text=message.html_text)
-            sent_count += 1
-            await asyncio.sleep(0.1) # Небольшая задержка для защиты от лимитов Telegram
-        except Exception as e:
-            logging.error(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-
-    await message.answer(LEXICON['mailing_completed'].format(count=sent_count))
-    await message.answer(LEXICON['admin_start_message'], reply_markup=kb.admin_panel_keyboard())
\ No newline at end of file
+    mailing_id = await rq.create_mailing(session, message.html_text, message.chat.id, progress_message.message_id)
+    broadcaster.start(mailing_id)
+
+    await message.answer(LEXICON['admin_start_message'], reply_markup=kb.admin_panel_keyboard())
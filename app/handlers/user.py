@@ -1,22 +1,25 @@
-import math
+import html
 import re
 from aiogram import Router, F, Bot
+from aiogram.filters import CommandStart, CommandObject
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, CallbackQuery, Document
+from aiogram.types import Message, CallbackQuery, Document, InputMediaPhoto, InlineQuery, InlineQueryResultCachedPhoto
+from aiogram.utils.deep_linking import create_start_link
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.exceptions import TelegramBadRequest
-import logging
 
 from app.lexicon.lexicon_ru import LEXICON, ORDER_STATUSES
 from app.keyboards import builders as kb
 from app.keyboards.reply import main_menu_reply_keyboard
 from app.keyboards.builders import (
-    ViewProduct, AddToCart, CatalogPage,
-    CancelCheckout, UserViewOrder, ConfirmReceipt
+    ViewProduct, AddToCart, CatalogPage, SearchPage,
+    CancelCheckout, UserViewOrder, ConfirmReceipt, UserOrdersPage
 )
 from app.database import requests as rq
 from app.config import config
+from app.services.catalog import catalog_cache
+from app.services.notifications import notify_admins
 
 # Создаем роутер для пользовательских обработчиков
 router = Router()
@@ -28,6 +31,10 @@ class Checkout(StatesGroup):
     waiting_for_phone_number = State()  # Ожидание ввода номера телефона
     waiting_for_receipt = State()       # Ожидание отправки чека
 
+# Состояние ожидания поискового запроса
+class Search(StatesGroup):
+    waiting_for_query = State()
+
 
 # --- Основное меню и навигация ---
 
@@ -51,6 +58,23 @@ async def cmd_menu_button(message: Message, session: AsyncSession, bot: Bot):
     await show_main_menu(bot, message.chat.id, message.from_user.id, message.from_user.username, session)
 
 
+@router.message(CommandStart(deep_link=True, magic=F.args.regexp(r'^product_\d+$')))
+async def cmd_start_product(message: Message, command: CommandObject, session: AsyncSession, bot: Bot):
+    """
+    /start по ссылке на товар (t.me/<бот>?start=product_<ID>, см. инлайн-режим):
+    вместо главного меню сразу открывается карточка товара.
+    """
+    await rq.get_user(session, message.from_user.id, message.from_user.username)
+    snapshot = await catalog_cache.get(session)
+    card = catalog_cache.product_card(snapshot, int(command.args.removeprefix('product_')))
+    if card is None:
+        # Товар уже удален - показываем обычное приветствие
+        await cmd_start(message, session, bot)
+        return
+    await message.answer("👋 Добро пожаловать в бот-магазин!", reply_markup=main_menu_reply_keyboard())
+    await message.answer_photo(photo=card.photo_id, caption=card.caption, reply_markup=card.markup)
+
+
 @router.message(F.text == '/start')
 async def cmd_start(message: Message, session: AsyncSession, bot: Bot):
     """
@@ -87,20 +111,17 @@ async def catalog(callback: CallbackQuery, session: AsyncSession, callback_data:
     Обработчик для отображения каталога товаров.
     Реагирует на нажатие кнопки 'Каталог' и на кнопки пагинации.
     """
-    page = callback_data.page if callback_data else 1  # Определяем текущую страницу
-    page_size = 5  # Количество товаров на странице
+    callback_data = callback_data or CatalogPage()  # Кнопка 'Каталог' открывает первую страницу
 
-    total_products = await rq.count_products(session)  # Считаем общее количество товаров
-    total_pages = math.ceil(total_products / page_size)  # Вычисляем общее количество страниц
-
-    products = await rq.get_products(session, page=page, page_size=page_size)  # Получаем товары для текущей страницы
-    products_list = list(products)
+    # Берем готовую клавиатуру страницы из кэша каталога (БД не используется, пока товары не менялись)
+    snapshot = await catalog_cache.get(session)
+    markup = snapshot.page_markup(callback_data.cursor, callback_data.forward)
 
     try:
         # Пытаемся отредактировать текущее сообщение, чтобы показать каталог
         await callback.message.edit_text(
             text=LEXICON['catalog_title'],
-            reply_markup=kb.catalog_keyboard(products_list, page, total_pages)
+            reply_markup=markup
         )
     except TelegramBadRequest:
         # Если редактирование не удалось (например, сообщение слишком старое), удаляем старое и отправляем новое
@@ -108,7 +129,7 @@ async def catalog(callback: CallbackQuery, session: AsyncSession, callback_data:
             await callback.message.delete()
             await callback.message.answer(
                 text=LEXICON['catalog_title'],
-                reply_markup=kb.catalog_keyboard(products_list, page, total_pages)
+                reply_markup=markup
             )
         except TelegramBadRequest:
             pass  # Игнорируем ошибки, если и это не удалось
@@ -116,16 +137,130 @@ async def catalog(callback: CallbackQuery, session: AsyncSession, callback_data:
     await callback.answer()
 
 
+# --- Поиск товаров ---
+
+# Количество найденных товаров на одной странице (как в каталоге)
+SEARCH_PAGE_SIZE = 5
+
+
+@router.callback_query(F.data == 'search')
+async def search_start(callback: CallbackQuery, state: FSMContext):
+    """Просит ввести поисковый запрос."""
+    await state.set_state(Search.waiting_for_query)
+    try:
+        await callback.message.edit_text(LEXICON['search_prompt'], reply_markup=kb.search_prompt_keyboard())
+    except TelegramBadRequest:
+        try:
+            await callback.message.delete()
+        except TelegramBadRequest:
+            pass
+        await callback.message.answer(LEXICON['search_prompt'], reply_markup=kb.search_prompt_keyboard())
+    await callback.answer()
+
+
+async def _search_page(session: AsyncSession, query: str, offset: int):
+    """Ищет товары и возвращает текст и клавиатуру страницы результатов."""
+    # Результаты поиска кэшируются целиком, страница - срез из них
+    found = await catalog_cache.search(session, query)
+    products = found[offset:offset + SEARCH_PAGE_SIZE]
+    if not products:
+        return LEXICON['search_nothing_found'].format(query=html.escape(query)), kb.search_prompt_keyboard()
+    has_prev, has_next = offset > 0, offset + SEARCH_PAGE_SIZE < len(found)
+    markup = kb.search_results_keyboard(products, offset, SEARCH_PAGE_SIZE, has_prev, has_next)
+    return LEXICON['search_results_title'].format(query=html.escape(query)), markup
+
+
+@router.message(Search.waiting_for_query, F.text)
+async def process_search_query(message: Message, state: FSMContext, session: AsyncSession):
+    """Показывает первую страницу результатов поиска."""
+    text, markup = await _search_page(session, message.text, 0)
+    # Запрос остается в данных FSM для перелистывания результатов; следующий текст - новый поиск
+    await state.update_data(search_query=message.text)
+    await message.answer(text, reply_markup=markup)
+
+
+@router.callback_query(SearchPage.filter())
+async def search_page(callback: CallbackQuery, callback_data: SearchPage, state: FSMContext, session: AsyncSession):
+    """Перелистывает результаты поиска."""
+    query = (await state.get_data()).get('search_query')
+    if not query:
+        # Запрос уже сброшен (например, после оформления заказа) - предлагаем искать заново
+        await search_start(callback, state)
+        return
+    text, markup = await _search_page(session, query, callback_data.offset)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest:
+        pass  # Сообщение не изменилось или слишком старое
+    await callback.answer()
+
+
+# --- Инлайн-режим (@бот запрос в любом чате) ---
+
+# Сколько товаров отдавать в одном ответе на инлайн-запрос (Telegram допускает до 50)
+INLINE_PAGE_SIZE = 20
+
+
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery, session: AsyncSession, bot: Bot):
+    """
+    Отвечает на инлайн-запрос товарами из каталога: пустой запрос - товары по порядку каталога,
+    иначе - результаты поиска. Используются тот же снимок каталога и кэш поиска, что и в боте,
+    поэтому популярные запросы не обращаются к БД.
+    """
+    snapshot = await catalog_cache.get(session)
+    if inline_query.query.strip():
+        products = await catalog_cache.search(session, inline_query.query)
+    else:
+        products = list(snapshot.products.values())
+
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    results = []
+    for product in products[offset:offset + INLINE_PAGE_SIZE]:
+        card = catalog_cache.product_card(snapshot, product.id)
+        if card is None:
+            continue
+        results.append(InlineQueryResultCachedPhoto(
+            id=str(product.id),
+            photo_file_id=product.photo_id,
+            title=product.name,
+            description=LEXICON['inline_product_description'].format(price=int(product.price)),
+            caption=card.caption,
+            reply_markup=kb.inline_product_keyboard(await create_start_link(bot, f'product_{product.id}'))
+        ))
+
+    next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(products) else ''
+    await inline_query.answer(
+        results,
+        cache_time=config.inline_cache_time,
+        is_personal=False,  # Результаты одинаковы для всех пользователей - Telegram может делиться кэшем
+        next_offset=next_offset
+    )
+
+
 @router.callback_query(ViewProduct.filter())
 async def product_detail(callback: CallbackQuery, callback_data: ViewProduct, session: AsyncSession):
-    """Обработчик для просмотра детальной информации о товаре."""
-    product = await session.get(rq.Product, callback_data.product_id)
-    if product:
-        # Формируем подпись к фото
-        caption_text = f"<b>{product.name}</b>\n"
-        if product.description:
-            caption_text += f"{product.description}\n\n"
-        caption_text += f"Цена: {int(product.price)} руб."
+    """
+    Обработчик для просмотра детальной информации о товаре.
+    При перелистывании карточек фото заменяется в том же сообщении (edit_message_media).
+    """
+    snapshot = await catalog_cache.get(session)
+    card = catalog_cache.product_card(snapshot, callback_data.product_id)
+    if card:
+        if callback.message.photo:
+            # Уже открыта карточка товара - меняем фото, подпись и кнопки на месте
+            try:
+                await callback.message.edit_media(
+                    media=InputMediaPhoto(media=card.photo_id, caption=card.caption),
+                    reply_markup=card.markup
+                )
+                await callback.answer()
+                return
+            except TelegramBadRequest as e:
+                if 'message is not modified' in e.message:
+                    await callback.answer()  # Эта карточка уже открыта
+                    return
+                # Сообщение слишком старое или удалено - отправим новое
 
         try:
             await callback.message.delete()
@@ -134,9 +269,9 @@ async def product_detail(callback: CallbackQuery, callback_data: ViewProduct, se
         
         # Отправляем фото с подписью и клавиатурой
         await callback.message.answer_photo(
-            photo=product.photo_id,
-            caption=caption_text,
-            reply_markup=kb.product_detail_keyboard(product.id, 'catalog_page_1')
+            photo=card.photo_id,
+            caption=card.caption,
+            reply_markup=card.markup
         )
     await callback.answer()
 
@@ -154,7 +289,7 @@ async def add_to_cart(callback: CallbackQuery, callback_data: AddToCart, session
     try:
         # Обновляем клавиатуру под фото товара
         await callback.message.edit_reply_markup(
-            reply_markup=kb.product_added_to_cart_keyboard(callback_data.product_id, 'catalog_page_1')
+            reply_markup=kb.product_added_to_cart_keyboard(callback_data.product_id)
         )
     except TelegramBadRequest:
         pass
@@ -212,19 +347,12 @@ async def cancel_checkout(callback: CallbackQuery, callback_data: CancelCheckout
     if order_id:
         # Если заказ уже был создан в БД, меняем его статус на 'canceled'
         await rq.update_order_status(session, order_id, 'canceled')
-        # Уведомляем админов об отмене
-        for admin_id in config.admin_ids:
-            try:
-                await bot.send_message(
-                    admin_id,
-                    LEXICON['admin_order_canceled_notification'].format(
-                        order_id=order_id,
-                        username=callback.from_user.username or "N/A",
-                        user_id=callback.from_user.id
-                    )
-                )
-            except Exception as e:
-                logging.error(f"Не удалось отправить уведомление об отмене админу {admin_id}: {e}")
+        # Уведомляем админов об отмене (в фоне, не задерживая ответ пользователю)
+        notify_admins(bot, LEXICON['admin_order_canceled_notification'].format(
+            order_id=order_id,
+            username=callback.from_user.username or "N/A",
+            user_id=callback.from_user.id
+        ))
 
     await state.clear()  # Сбрасываем состояние FSM
     try:
@@ -293,30 +421,21 @@ async def process_phone_number(message: Message, state: FSMContext, session: Asy
     user = await rq.get_user(session, message.from_user.id, message.from_user.username)
     delivery_details = await state.get_data()
 
-    # Получаем товары из корзины для создания заказа
-    cart_items = await rq.get_cart_items_for_order(session, user.id)
-    items = cart_items.all()
+    # Создаем заказ в базе данных: товары переносятся из корзины, а корзина очищается в той же транзакции
+    placed_order = await rq.place_order(session, user.id, delivery_details)
 
-    if not items: # Проверка на случай, если корзина опустела
+    if not placed_order: # Проверка на случай, если корзина опустела
         await message.answer(LEXICON['empty_cart'], reply_markup=kb.back_to_main_menu_keyboard())
         await state.clear()
         return
+    order_id, total_price, items = placed_order
 
     # Собираем текстовое представление заказа
-    products_text = ""
-    total_price = 0
-    for item in items:
-        products_text += f"▫️ {item.name} ({int(item.price)} руб.)\n"
-        total_price += item.price
-
-    # Создаем заказ в базе данных
-    order_id = await rq.place_order(session, user.id, delivery_details)
+    products_text = "".join(
+        f"▫️ {item.product_name} x{item.quantity} - {int(item.product_price * item.quantity)} руб.\n"
+        for item in items
+    )
 
-    if not order_id: # Если по какой-то причине заказ не создался
-        await message.answer(LEXICON['error_message'])
-        await state.clear()
-        return
-        
     await state.update_data(order_id=order_id)
     await state.set_state(Checkout.waiting_for_receipt) # Переходим в состояние ожидания чека
             
@@ -333,8 +452,6 @@ async def process_phone_number(message: Message, state: FSMContext, session: Asy
         ),
         reply_markup=kb.cancel_checkout_keyboard(order_id=order_id)
     )
-    # Очищаем корзину после успешного оформления
-    await rq.clear_cart(session, user.id)
 
 
 @router.message(Checkout.waiting_for_receipt, F.document)
@@ -354,20 +471,16 @@ async def process_receipt(message: Message, state: FSMContext, session: AsyncSes
 
     await message.answer(LEXICON['receipt_received'])
 
-    # Уведомляем всех администраторов о новом оплаченном заказе
-    for admin_id in config.admin_ids:
-        try:
-            await bot.send_message(
-                admin_id,
-                LEXICON['admin_receipt_notification'].format(
-                    order_id=order_id,
-                    username=message.from_user.username or 'N/A',
-                    user_id=message.from_user.id
-                ),
-                reply_markup=kb.admin_receipt_notification_keyboard()
-            )
-        except Exception as e:
-            logging.error(f"Не удалось отправить уведомление админу {admin_id}: {e}")
+    # Уведомляем всех администраторов о новом оплаченном заказе (в фоне)
+    notify_admins(
+        bot,
+        LEXICON['admin_receipt_notification'].format(
+            order_id=order_id,
+            username=message.from_user.username or 'N/A',
+            user_id=message.from_user.id
+        ),
+        reply_markup=kb.admin_receipt_notification_keyboard()
+    )
 
     # Завершающее сообщение для пользователя
     await message.answer(
@@ -380,16 +493,19 @@ async def process_receipt(message: Message, state: FSMContext, session: AsyncSes
 # --- История заказов пользователя ---
 
 @router.callback_query(F.data == 'my_orders')
-async def my_orders(callback: CallbackQuery, session: AsyncSession):
-    """Обработчик для просмотра истории заказов."""
+@router.callback_query(UserOrdersPage.filter())
+async def my_orders(callback: CallbackQuery, session: AsyncSession, callback_data: UserOrdersPage | None = None):
+    """Обработчик для просмотра истории заказов (постранично)."""
+    callback_data = callback_data or UserOrdersPage()  # Кнопка 'Мои заказы' открывает самые новые заказы
     user = await rq.get_user(session, callback.from_user.id, callback.from_user.username)
-    orders = await rq.get_user_orders(session, user.id)
-    orders_list = orders.all()
+    orders_list, has_prev, has_next = await rq.get_user_orders(
+        session, user.id, cursor=callback_data.cursor, forward=callback_data.forward
+    )
 
     try:
         await callback.message.edit_text(
             text=LEXICON['no_orders'] if not orders_list else LEXICON['order_history_title'],
-            reply_markup=kb.user_orders_keyboard(orders_list)
+            reply_markup=kb.user_orders_keyboard(orders_list, has_prev, has_next)
         )
     except TelegramBadRequest:
         try:
@@ -398,7 +514,7 @@ async def my_orders(callback: CallbackQuery, session: AsyncSession):
             pass
         await callback.message.answer(
             text=LEXICON['no_orders'] if not orders_list else LEXICON['order_history_title'],
-            reply_markup=kb.user_orders_keyboard(orders_list)
+            reply_markup=kb.user_orders_keyboard(orders_list, has_prev, has_next)
         )
     await callback.answer()
 
@@ -406,7 +522,7 @@ async def my_orders(callback: CallbackQuery, session: AsyncSession):
 @router.callback_query(UserViewOrder.filter())
 async def view_user_order(callback: CallbackQuery, callback_data: UserViewOrder, session: AsyncSession):
     """Обработчик для просмотра деталей конкретного заказа пользователем."""
-    user = await rq.get_user(session, callback.from_user.id)
+    user = await rq.get_user(session, callback.from_user.id, callback.from_user.username)
     # Получаем детали заказа, убедившись, что он принадлежит этому пользователю
     order, order_items = await rq.get_user_order_details(session, callback_data.order_id, user.id)
 
@@ -415,9 +531,11 @@ async def view_user_order(callback: CallbackQuery, callback_data: UserViewOrder,
         return
         
     # Формируем текст с деталями заказа
-    products_text = "\n".join([f"  - {item.product_name} ({int(item.product_price)} руб.)" for item in order_items])
-    total_price = sum(item.product_price for item in order_items)
-    products_text += f"\n\n<b>Итого: {int(total_price)} руб.</b>"
+    products_text = "\n".join([
+        f"  - {item.product_name} x{item.quantity} ({int(item.product_price * item.quantity)} руб.)"
+        for item in order_items
+    ])
+    products_text += f"\n\n<b>Итого: {int(order.total_amount)} руб.</b>"
 
     text = LEXICON['user_order_details'].format(
         order_id=order.id,
@@ -447,18 +565,11 @@ async def confirm_order_receipt(callback: CallbackQuery, callback_data: ConfirmR
     """Обработчик подтверждения получения заказа пользователем."""
     await rq.update_order_status(session, callback_data.order_id, 'completed')
 
-    # Уведомляем админов о завершении заказа
-    for admin_id in config.admin_ids:
-        try:
-            await bot.send_message(
-                admin_id,
-                LEXICON['admin_receipt_confirmed_notification'].format(
-                    order_id=callback_data.order_id,
-                    username=callback.from_user.username or "N/A"
-                )
-            )
-        except Exception as e:
-            logging.error(f"Ошибка отправки уведомления админу о завершении заказа: {e}")
+    # Уведомляем админов о завершении заказа (в фоне)
+    notify_admins(bot, LEXICON['admin_receipt_confirmed_notification'].format(
+        order_id=callback_data.order_id,
+        username=callback.from_user.username or "N/A"
+    ))
 
     try:
         await callback.message.edit_text(text=LEXICON['order_receipt_confirmed_user'])
@@ -28,9 +28,14 @@ class ChangeStatus(CallbackData, prefix="change_status"):
 class ViewProduct(CallbackData, prefix="view_prod"):
     product_id: int
 
-# Для навигации по страницам каталога
+# Для навигации по страницам каталога (keyset-пагинация по ID товара)
 class CatalogPage(CallbackData, prefix="catalog_page"):
-    page: int
+    cursor: int = 0       # ID товара, от которого отсчитывается страница (0 - первая страница)
+    forward: bool = True  # True - товары после cursor, False - товары перед cursor
+
+# Для навигации по результатам поиска (сам запрос хранится в FSM, в callback_data он может не поместиться)
+class SearchPage(CallbackData, prefix="search_page"):
+    offset: int = 0
 
 # Для добавления товара в корзину
 class AddToCart(CallbackData, prefix="add_cart"):
@@ -56,6 +61,16 @@ class UserViewOrder(CallbackData, prefix="user_view_order"):
 class ConfirmReceipt(CallbackData, prefix="confirm_receipt"):
     order_id: int
 
+# Для навигации по списку всех заказов (админка, keyset-пагинация по ID заказа)
+class OrdersPage(CallbackData, prefix="orders_page"):
+    cursor: int = 0       # ID заказа, от которого отсчитывается страница (0 - самые новые)
+    forward: bool = True  # True - более старые заказы, False - более новые
+
+# Для навигации по истории заказов пользователя
+class UserOrdersPage(CallbackData, prefix="my_orders_page"):
+    cursor: int = 0
+    forward: bool = True
+
 # Для управления конкретным товаром (админка)
 class ManageProduct(CallbackData, prefix="mng_prod"):
     product_id: int
@@ -111,7 +126,25 @@ def cancel_fsm_keyboard():
     ))
     return builder.as_markup()
 
-def catalog_keyboard(products: list[Product], page: int, total_pages: int):
+def _pagination_buttons(page_factory: type[CallbackData], items: list, has_prev: bool, has_next: bool):
+    """
+    Собирает кнопки "Назад" / "Вперед" для keyset-пагинации.
+    Курсорами служат ID первого и последнего элемента текущей страницы.
+    """
+    nav_buttons = []
+    if items and has_prev:
+        nav_buttons.append(InlineKeyboardButton(
+            text="◀️ Назад",
+            callback_data=page_factory(cursor=items[0].id, forward=False).pack()
+        ))
+    if items and has_next:
+        nav_buttons.append(InlineKeyboardButton(
+            text="Вперед ▶️",
+            callback_data=page_factory(cursor=items[-1].id, forward=True).pack()
+        ))
+    return nav_buttons
+
+def catalog_keyboard(products: list[Product], has_prev: bool, has_next: bool):
     """Создает клавиатуру для каталога с товарами и кнопками навигации."""
     builder = InlineKeyboardBuilder()
     # Добавляем кнопки для каждого товара
@@ -122,40 +155,86 @@ def catalog_keyboard(products: list[Product], page: int, total_pages: int):
         ))
     
     # Добавляем кнопки навигации "Вперед" / "Назад"
+    nav_buttons = _pagination_buttons(CatalogPage, products, has_prev, has_next)
+    if nav_buttons:
+        builder.row(*nav_buttons)  # Добавляем кнопки навигации в один ряд
+
+    builder.row(InlineKeyboardButton(text=LEXICON['search_button'], callback_data='search'))
+    builder.row(InlineKeyboardButton(text=LEXICON['back_to_main_menu'], callback_data='to_main_menu'))
+    return builder.as_markup()
+
+def search_results_keyboard(products: list, offset: int, page_size: int, has_prev: bool, has_next: bool):
+    """Создает клавиатуру с найденными товарами (в стиле каталога) и кнопками навигации по результатам."""
+    builder = InlineKeyboardBuilder()
+    for product in products:
+        builder.row(InlineKeyboardButton(
+            text=f'{product.name} - {int(product.price)} руб.',
+            callback_data=ViewProduct(product_id=product.id).pack()
+        ))
+
     nav_buttons = []
-    if page > 1:
+    if has_prev:
         nav_buttons.append(InlineKeyboardButton(
             text="◀️ Назад",
-            callback_data=CatalogPage(page=page - 1).pack()
+            callback_data=SearchPage(offset=max(offset - page_size, 0)).pack()
         ))
-    if page < total_pages:
+    if has_next:
         nav_buttons.append(InlineKeyboardButton(
             text="Вперед ▶️",
-            callback_data=CatalogPage(page=page + 1).pack()
+            callback_data=SearchPage(offset=offset + page_size).pack()
         ))
-    
     if nav_buttons:
-        builder.row(*nav_buttons)  # Добавляем кнопки навигации в один ряд
+        builder.row(*nav_buttons)
+
+    builder.row(InlineKeyboardButton(text=LEXICON['search_again_button'], callback_data='search'))
+    builder.row(InlineKeyboardButton(text=LEXICON['catalog_button'], callback_data='catalog'))
+    return builder.as_markup()
+
+def inline_product_keyboard(url: str):
+    """
+    Клавиатура под товаром, отправленным через инлайн-режим. Такое сообщение может оказаться
+    в любом чате, поэтому вместо callback-кнопок - ссылка, открывающая товар в боте.
+    """
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text=LEXICON['inline_open_in_bot_button'], url=url))
+    return builder.as_markup()
 
+def search_prompt_keyboard():
+    """Клавиатура под приглашением ввести поисковый запрос."""
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text=LEXICON['catalog_button'], callback_data='catalog'))
     builder.row(InlineKeyboardButton(text=LEXICON['back_to_main_menu'], callback_data='to_main_menu'))
     return builder.as_markup()
 
-def product_detail_keyboard(product_id: int, back_callback: str = 'catalog'):
-    """Создает клавиатуру для страницы с деталями товара."""
+def product_detail_keyboard(product_id: int, back_callback: str | None = None,
+                            prev_id: int | None = None, next_id: int | None = None):
+    """
+    Создает клавиатуру для страницы с деталями товара.
+    prev_id / next_id - соседние товары каталога для перелистывания карточек.
+    """
+    if back_callback is None:
+        # По умолчанию возвращаемся на страницу каталога, на которой находится товар
+        back_callback = CatalogPage(cursor=product_id - 1).pack()
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(
         text='➕ Добавить в корзину',
         callback_data=AddToCart(product_id=product_id).pack()
     ))
-    # Логика для кнопки "Назад", чтобы вернуться на правильную страницу каталога
-    if back_callback == 'catalog_page_1':
-        builder.row(InlineKeyboardButton(text=LEXICON['back_button'], callback_data=CatalogPage(page=1).pack()))
-    else:
-        builder.row(InlineKeyboardButton(text=LEXICON['back_button'], callback_data=back_callback))
+    nav_buttons = []
+    if prev_id is not None:
+        nav_buttons.append(InlineKeyboardButton(text="◀️", callback_data=ViewProduct(product_id=prev_id).pack()))
+    if next_id is not None:
+        nav_buttons.append(InlineKeyboardButton(text="▶️", callback_data=ViewProduct(product_id=next_id).pack()))
+    if nav_buttons:
+        builder.row(*nav_buttons)
+    builder.row(InlineKeyboardButton(text=LEXICON['back_button'], callback_data=back_callback))
     return builder.as_markup()
 
-def product_added_to_cart_keyboard(product_id: int, back_callback: str = 'catalog'):
+def product_added_to_cart_keyboard(product_id: int, back_callback: str | None = None):
     """Клавиатура, которая показывается после добавления товара в корзину."""
+    if back_callback is None:
+        # По умолчанию возвращаемся на страницу каталога, на которой находится товар
+        back_callback = CatalogPage(cursor=product_id - 1).pack()
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(
         text='➕ Добавить еще',
@@ -165,10 +244,7 @@ def product_added_to_cart_keyboard(product_id: int, back_callback: str = 'catalo
         text=LEXICON['cart_button'],
         callback_data='my_cart'
     ))
-    if back_callback == 'catalog_page_1':
-        builder.row(InlineKeyboardButton(text=LEXICON['back_button'], callback_data=CatalogPage(page=1).pack()))
-    else:
-        builder.row(InlineKeyboardButton(text=LEXICON['back_button'], callback_data=back_callback))
+    builder.row(InlineKeyboardButton(text=LEXICON['back_button'], callback_data=back_callback))
     return builder.as_markup()
 
 def cart_keyboard(items: list):
@@ -208,15 +284,18 @@ def pickup_point_keyboard():
     ))
     return builder.as_markup()
 
-def user_orders_keyboard(orders: list):
+def user_orders_keyboard(orders: list, has_prev: bool = False, has_next: bool = False):
     """Создает клавиатуру со списком заказов пользователя."""
     builder = InlineKeyboardBuilder()
     for order in orders:
         status_text = ORDER_STATUSES.get(order.status, order.status) # Получаем текстовое представление статуса
         builder.row(InlineKeyboardButton(
-            text=f'Заказ #{order.id} (Статус: {status_text})',
+            text=f'Заказ #{order.id} на {int(order.total_amount)} руб. (Статус: {status_text})',
             callback_data=UserViewOrder(order_id=order.id).pack()
         ))
+    nav_buttons = _pagination_buttons(UserOrdersPage, orders, has_prev, has_next)
+    if nav_buttons:
+        builder.row(*nav_buttons)
     builder.row(InlineKeyboardButton(text=LEXICON['back_to_main_menu'], callback_data='to_main_menu'))
     return builder.as_markup()
 
@@ -241,15 +320,18 @@ def user_order_detail_keyboard(order_id: int, status: str, track_number: str | N
     ))
     return builder.as_markup()
 
-def admin_list_orders_keyboard(orders: list):
-    """Создает клавиатуру со списком всех заказов для админа."""
+def admin_list_orders_keyboard(orders: list, has_prev: bool = False, has_next: bool = False):
+    """Создает клавиатуру со списком заказов для админа (одна страница)."""
     builder = InlineKeyboardBuilder()
     for order in orders:
         status_text = ORDER_STATUSES.get(order.status, order.status)
         builder.row(InlineKeyboardButton(
-            text=f'Заказ #{order.id} (Статус: {status_text})',
+            text=f'Заказ #{order.id} на {int(order.total_amount)} руб. (Статус: {status_text})',
             callback_data=ViewOrder(order_id=order.id).pack()
         ))
+    nav_buttons = _pagination_buttons(OrdersPage, orders, has_prev, has_next)
+    if nav_buttons:
+        builder.row(*nav_buttons)
     builder.row(InlineKeyboardButton(text=LEXICON['back_button'], callback_data='admin_panel'))
     return builder.as_markup()
 
@@ -47,6 +47,15 @@ LEXICON: dict[str, str] = {
     'order_history_title': '📦 <b>Ваши заказы</b>\n\nНажмите на заказ для просмотра деталей.',
     'no_orders': 'У вас еще нет заказов.',
     'item_added_to_cart': '✅ Товар добавлен в корзину!',
+    'throttled': '⏳ Слишком часто, подождите пару секунд.',
+    'throttled_message': '⏳ Слишком много сообщений подряд. Подождите пару секунд и отправьте последнее сообщение еще раз.',
+    'search_button': '🔎 Поиск',
+    'search_prompt': '🔎 Введите название товара или слово из описания:',
+    'search_results_title': '🔎 Результаты поиска по запросу «{query}»:',
+    'search_nothing_found': '😔 По запросу «{query}» ничего не найдено. Попробуйте другое слово.',
+    'search_again_button': '🔎 Новый поиск',
+    'inline_product_description': 'Цена: {price} руб.',
+    'inline_open_in_bot_button': '🛒 Открыть в боте',
     'checkout_button': '✅ Оформить заказ',
     'clear_cart_button': '🗑️ Очистить корзину',
     'back_to_main_menu': '⬅️ Назад в главное меню',
@@ -105,9 +114,13 @@ LEXICON: dict[str, str] = {
         '   - Отменено: {canceled_orders}\n\n'
         'Общая сумма завершенных заказов: {total_revenue} руб.'
     ),
+    'stats_rebuilt': '🔄 Счетчики статистики пересчитаны по всей истории заказов.',
+    'search_index_rebuilt': '🔎 Поисковый индекс перестроен, товаров в индексе: {count}.',
     'enter_mailing_text': 'Введите текст для рассылки. Пользователи получат это сообщение от имени бота. Вы можете использовать <b>HTML</b>-разметку.',
     'mailing_started': '✅ Рассылка запущена. Это может занять некоторое время.',
+    'mailing_progress': '📢 Рассылка #{mailing_id} выполняется...\n\nОтправлено: {sent} из {total}\nНе доставлено: {failed}',
     'mailing_completed': '✅ Рассылка завершена! Отправлено {count} сообщений.',
+    'mailing_completed_with_errors': '✅ Рассылка #{mailing_id} завершена! Отправлено {count} сообщений, не доставлено: {failed}.',
     'mailing_canceled': 'Рассылка отменена.',
     'cancel_mailing_button': '❌ Отменить',
     'admin_order_canceled_notification': '❌ Заказ #{order_id} был отменен пользователем @{username} (ID: {user_id}) на этапе оформления.',
@@ -117,6 +130,20 @@ LEXICON: dict[str, str] = {
     'admin_add_product_photo': 'Отправьте фото товара:',
     'admin_add_product_price': 'Введите цену товара (только число):',
     'admin_product_added': '✅ Товар "{name}" успешно добавлен!',
+    'import_products_prompt': (
+        '📥 <b>Импорт товаров</b>\n\n'
+        'Отправьте файл <b>CSV</b> или <b>XLSX</b>. Первая строка - заголовки столбцов:\n'
+        '<code>name</code> (название), <code>price</code> (цена), <code>photo_id</code> (file ID фото в Telegram), '
+        '<code>description</code> (описание, необязательно).\n\n'
+        'Можно использовать русские заголовки: название, цена, фото, описание.'
+    ),
+    'import_products_unsupported': '❌ Поддерживаются только файлы .csv и .xlsx.',
+    'import_products_too_large': '❌ Файл слишком большой (Telegram позволяет боту скачивать файлы до 20 МБ).',
+    'import_products_started': '⏳ Импортирую товары...',
+    'import_products_failed': '❌ Файл не импортирован: {reason}',
+    'import_products_failed_partial': '❌ Импорт прерван: {reason}\n\nДо ошибки уже добавлено товаров: <b>{accepted}</b>. Перед повторной загрузкой удалите из файла уже добавленные строки, иначе товары продублируются.',
+    'import_products_done': '✅ Импорт завершен.\n\nДобавлено товаров: <b>{accepted}</b>\nОтклонено строк: <b>{rejected}</b>',
+    'import_products_errors': '\n\n<b>Ошибки</b> (первые {count}):\n{errors}',
     'admin_no_orders': 'Пока нет ни одного заказа.',
     'admin_list_orders_title': '📋 Нажмите на заказ для управления:',
     'admin_order_details': (
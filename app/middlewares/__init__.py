@@ -0,0 +1,10 @@
+from app.middlewares.db import DbSessionMiddleware, LazySession
+from app.middlewares.metrics import MetricsMiddleware, HandlerNameMiddleware
+from app.middlewares.query_budget import QuerySamplingMiddleware
+from app.middlewares.throttling import ThrottlingMiddleware, RateLimit
+from app.middlewares.coalescing import CallbackCoalescingMiddleware
+
+__all__ = [
+    'DbSessionMiddleware', 'LazySession', 'MetricsMiddleware', 'HandlerNameMiddleware', 'QuerySamplingMiddleware',
+    'ThrottlingMiddleware', 'RateLimit', 'CallbackCoalescingMiddleware'
+]
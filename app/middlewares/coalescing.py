@@ -0,0 +1,40 @@
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, CallbackQuery
+
+from app.services.metrics import COALESCED_CALLBACKS
+
+
+class CallbackCoalescingMiddleware(BaseMiddleware):
+    """
+    Внешний (outer) middleware для нажатий кнопок: если такое же нажатие (тот же пользователь,
+    те же callback_data) еще обрабатывается, повторное сразу получает пустой callback.answer
+    и не доходит до хэндлера. Так двойное нажатие на медленной сети не дает повторных
+    правок сообщения, записей в БД и уведомлений.
+    """
+
+    def __init__(self):
+        self._in_flight: set[tuple[int, str]] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, CallbackQuery) or not event.data:
+            return await handler(event, data)
+
+        key = (event.from_user.id, event.data)
+        if key in self._in_flight:
+            COALESCED_CALLBACKS.inc()
+            # Результат увидит пользователь после первого нажатия - здесь только убираем "часики"
+            await event.answer()
+            return None
+
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
@@ -0,0 +1,68 @@
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+class LazySession:
+    """
+    Ленивая обертка над AsyncSession: настоящая сессия (и соединение из пула)
+    создается только при первом обращении к ней. Все атрибуты и методы
+    (execute, get, add, commit и т.д.) перенаправляются в настоящую сессию,
+    поэтому для хэндлеров и функций из requests.py она ничем не отличается от AsyncSession.
+    """
+    __slots__ = ('_session_pool', '_session')
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self._session_pool = session_pool
+        self._session: AsyncSession | None = None
+
+    @property
+    def is_opened(self) -> bool:
+        """Была ли уже создана настоящая сессия."""
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_pool()
+        return getattr(self._session, name)
+
+    async def release(self):
+        """Закрывает настоящую сессию, если она была создана."""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+
+# Middleware для управления сессиями базы данных
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Регистрируется как внутренний (inner) middleware роутеров, поэтому вызывается
+    уже для выбранного хэндлера. Хэндлерам без аргумента session сессия не передается вовсе,
+    остальным передается LazySession, которая берет соединение только при первом запросе к БД.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self.session_pool = session_pool
+
+    # Этот метод вызывается для каждого обновления, для которого найден хэндлер
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        if handler_object is not None and not handler_object.varkw and 'session' not in handler_object.params:
+            # Хэндлеру не нужна БД - не создаем даже ленивую сессию
+            return await handler(event, data)
+
+        session = LazySession(self.session_pool)
+        # "Прокидываем" сессию в данные, доступные внутри хэндлера
+        data["session"] = session
+        try:
+            # Вызываем следующий обработчик в цепочке, передавая ему обновленные данные
+            return await handler(event, data)
+        finally:
+            await session.release()
@@ -0,0 +1,62 @@
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.services.metrics import (
+    HANDLER_DURATION, HANDLER_EXCEPTIONS, HANDLER_IN_FLIGHT, UPDATE_SQL_STATEMENTS,
+    UpdateStats, current_update
+)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Внешний (outer) middleware диспетчера: измеряет полное время обработки обновления,
+    считает исключения и SQL-запросы. Имя хэндлера становится известно позже -
+    его записывает HandlerNameMiddleware, когда фильтры выбрали хэндлер.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = UpdateStats()
+        token = current_update.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_EXCEPTIONS.inc(handler=stats.handler, exception=type(e).__name__)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler=stats.handler)
+            UPDATE_SQL_STATEMENTS.observe(stats.sql_statements, handler=stats.handler)
+            current_update.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """
+    Внутренний (inner) middleware роутеров: запоминает имя выбранного хэндлера
+    (например, catalog или process_receipt) и считает обновления в обработке.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(handler_object.callback, '__name__', 'unknown') if handler_object else 'unknown'
+        stats = current_update.get()
+        if stats is not None:
+            stats.handler = name
+
+        HANDLER_IN_FLIGHT.inc(handler=name)
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_IN_FLIGHT.dec(handler=name)
@@ -0,0 +1,46 @@
+import logging
+import random
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.database.query_budget import QueryLog, count_queries
+from app.services.metrics import current_update
+
+# Получаем логгер для этого модуля
+logger = logging.getLogger(__name__)
+
+
+class QuerySamplingMiddleware(BaseMiddleware):
+    """
+    Внешний (outer) middleware: для случайной доли обновлений (sample_rate) записывает все SQL-запросы
+    и пишет в лог предупреждение, если обновление превысило бюджет запросов, повторило
+    один и тот же запрос или похоже на N+1. Для остальных обновлений ничего не делает.
+    """
+
+    def __init__(self, sample_rate: float, budget: int):
+        self.sample_rate = sample_rate
+        self.budget = budget
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if random.random() >= self.sample_rate:
+            return await handler(event, data)
+
+        with count_queries() as log:
+            try:
+                return await handler(event, data)
+            finally:
+                self._check(log)
+
+    def _check(self, log: QueryLog):
+        if log.count <= self.budget and not log.duplicates() and not log.repeated():
+            return
+        stats = current_update.get()
+        handler_name = stats.handler if stats else 'unknown'
+        logger.warning(f"Хэндлер {handler_name}: подозрительные SQL-запросы (бюджет {self.budget}).\n{log.report()}")
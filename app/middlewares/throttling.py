@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Awaitable, Iterable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, CallbackQuery, Message
+
+from app.lexicon.lexicon_ru import LEXICON
+from app.services.metrics import THROTTLED_UPDATES
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Ограничение для корзины токенов: rate токенов в секунду, не больше burst подряд."""
+    rate: float
+    burst: int
+
+    @property
+    def refill_time(self) -> float:
+        """За сколько секунд пустая корзина наполняется полностью."""
+        return self.burst / self.rate
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated_at', 'notified')
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+        self.notified = False  # Пользователь уже предупрежден, что его сообщения отбрасываются
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внешний (outer) middleware для сообщений и нажатий кнопок: у каждого пользователя своя
+    корзина токенов на каждый вид действий (сообщения, кнопки, изменяющие данные действия).
+    Если токенов нет, обновление отбрасывается до выбора хэндлера, поэтому БД не затрагивается;
+    на нажатие кнопки отвечаем только всплывающим уведомлением, а на сообщение - коротким
+    ответом, но только на первое отброшенное подряд (иначе сами ответы стали бы флудом).
+    Без ответа покупатель, чей телефон или чек при оформлении заказа был отброшен,
+    ждал бы следующего шага впустую.
+
+    Корзины хранятся в памяти в порядке последнего обращения. Корзина, которая успела
+    полностью наполниться, ничем не отличается от новой, поэтому такие корзины удаляются
+    при следующих обращениях, а общее число корзин ограничено max_buckets.
+    """
+
+    def __init__(
+        self,
+        message_limit: RateLimit,
+        callback_limit: RateLimit,
+        write_limit: RateLimit,
+        write_callbacks: Iterable[str] = (),
+        write_states: Iterable[str] = (),
+        exempt_user_ids: Iterable[int] = (),
+        max_buckets: int = 100_000,
+    ):
+        self.limits = {'message': message_limit, 'callback': callback_limit, 'write': write_limit}
+        self.write_callbacks = frozenset(write_callbacks)  # Префиксы callback_data (до первого ':')
+        self.write_states = tuple(write_states)            # Префиксы FSM-состояний, например 'Checkout:'
+        self.exempt_user_ids = frozenset(exempt_user_ids)
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[tuple[int, str], _Bucket] = OrderedDict()
+
+    def _kind(self, event: TelegramObject, raw_state: str | None) -> str:
+        if isinstance(event, CallbackQuery):
+            if event.data and event.data.split(':', 1)[0] in self.write_callbacks:
+                return 'write'
+            return 'callback'
+        if raw_state and raw_state.startswith(self.write_states):
+            return 'write'
+        return 'message'
+
+    def _evict(self, now: float):
+        """Удаляет полностью наполнившиеся корзины (с начала очереди) и лишние корзины сверх лимита."""
+        while self._buckets:
+            (_, kind), bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_buckets and now - bucket.updated_at < self.limits[kind].refill_time:
+                break
+            self._buckets.popitem(last=False)
+
+    def allow(self, user_id: int, kind: str) -> bool:
+        """Списывает токен из корзины пользователя. Возвращает False, если токенов не осталось."""
+        limit = self.limits[kind]
+        now = time.monotonic()
+        key = (user_id, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(limit.burst, now)
+        else:
+            bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.updated_at) * limit.rate)
+            bucket.updated_at = now
+            self._buckets.move_to_end(key)
+        self._evict(now)
+
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        bucket.notified = False
+        return True
+
+    def should_notify(self, user_id: int, kind: str) -> bool:
+        """True только для первого отброшенного подряд обновления (до следующего пропущенного)."""
+        bucket = self._buckets.get((user_id, kind))
+        if bucket is None or bucket.notified:
+            return False
+        bucket.notified = True
+        return True
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None or user.id in self.exempt_user_ids:
+            return await handler(event, data)
+
+        kind = self._kind(event, data.get('raw_state'))
+        if self.allow(user.id, kind):
+            return await handler(event, data)
+
+        THROTTLED_UPDATES.inc(kind=kind)
+        if isinstance(event, CallbackQuery):
+            # Убираем "часики" на кнопке, иначе клиент будет повторять нажатие
+            await event.answer(LEXICON['throttled'])
+        elif isinstance(event, Message) and self.should_notify(user.id, kind):
+            # Просим отправить сообщение еще раз: состояние FSM не изменилось, шаг ждет ответа
+            await event.answer(LEXICON['throttled_message'])
+        return None
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import config
+from app.database import requests as rq
+from app.lexicon.lexicon_ru import LEXICON
+
+# Получаем логгер для этого модуля
+logger = logging.getLogger(__name__)
+
+# Как часто (в секундах) обновлять сообщение с прогрессом рассылки у админа
+PROGRESS_EDIT_INTERVAL = 3
+# Сколько раз пытаться отправить сообщение одному пользователю после TelegramRetryAfter
+MAX_SEND_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости "token bucket": не более rate запросов в секунду
+    с допустимым всплеском до capacity. При TelegramRetryAfter приостанавливается целиком.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ждет, пока появится свободный токен, и забирает его."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                # Пополняем корзину пропорционально прошедшему времени
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (Telegram попросил подождать)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class Broadcaster:
+    """
+    Движок рассылок. Каждая рассылка выполняется фоновой задачей: пользователи
+    читаются из БД порциями по mailing_batch_size, а отправляются группами по
+    mailing_concurrency сообщений параллельно (с ограничением общей скорости).
+    После каждой группы прогресс сохраняется в таблицу mailings, поэтому после
+    перезапуска бота рассылка продолжается с места остановки: повторно могут уйти
+    только сообщения группы, отправка которой была прервана (не больше mailing_concurrency).
+    """
+
+    def __init__(self, bot: Bot, session_pool: async_sessionmaker):
+        self.bot = bot
+        self.session_pool = session_pool
+        self._limiter = TokenBucket(config.mailing_rate_limit)
+        self._semaphore = asyncio.Semaphore(config.mailing_concurrency)
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def start(self, mailing_id: int):
+        """Запускает (или продолжает) рассылку в фоне и сразу возвращает управление."""
+        if mailing_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(mailing_id), name=f'mailing-{mailing_id}')
+        self._tasks[mailing_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(mailing_id, None))
+
+    async def resume_pending(self):
+        """Продолжает рассылки, прерванные перезапуском бота."""
+        async with self.session_pool() as session:
+            mailing_ids = await rq.get_running_mailing_ids(session)
+        for mailing_id in mailing_ids:
+            logger.info(f"Продолжаю прерванную рассылку #{mailing_id}")
+            self.start(mailing_id)
+
+    async def stop(self):
+        """Останавливает все рассылки (прогресс уже сохранен после последней отправленной группы)."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, mailing_id: int):
+        try:
+            async with self.session_pool() as session:
+                mailing = await rq.get_mailing(session, mailing_id)
+            if mailing is None or mailing.status != 'running':
+                return
+
+            cursor, sent, failed = mailing.cursor, mailing.sent_count, mailing.failed_count
+            last_progress_at = 0.0
+            while True:
+                async with self.session_pool() as session:
+                    users = await rq.get_users_batch(session, cursor, config.mailing_batch_size)
+                if not users:
+                    break
+
+                # Группа не больше числа одновременных запросов: параллельность не страдает,
+                # а курсор сохраняется после каждой группы
+                group_size = config.mailing_concurrency
+                for start in range(0, len(users), group_size):
+                    group = users[start:start + group_size]
+                    results = await asyncio.gather(*(self._send(user.tg_id, mailing.text) for user in group))
+                    group_sent = sum(results)
+                    group_failed = len(results) - group_sent
+                    cursor = group[-1].id
+                    sent += group_sent
+                    failed += group_failed
+
+                    async with self.session_pool() as session:
+                        await rq.save_mailing_progress(session, mailing_id, cursor, group_sent, group_failed)
+
+                    if time.monotonic() - last_progress_at >= PROGRESS_EDIT_INTERVAL:
+                        last_progress_at = time.monotonic()
+                        await self._show_progress(mailing, LEXICON['mailing_progress'].format(
+                            mailing_id=mailing_id, sent=sent, total=max(mailing.total, sent + failed), failed=failed
+                        ))
+
+            async with self.session_pool() as session:
+                await rq.save_mailing_progress(session, mailing_id, cursor, 0, 0, completed=True)
+            await self._show_progress(mailing, LEXICON['mailing_completed_with_errors'].format(
+                mailing_id=mailing_id, count=sent, failed=failed
+            ))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Рассылка #{mailing_id} прервана ошибкой: {e}")
+
+    async def _send(self, chat_id: int, text: str) -> bool:
+        """Отправляет одно сообщение с учетом лимитов. Возвращает True при успехе."""
+        async with self._semaphore:
+            for _ in range(MAX_SEND_ATTEMPTS):
+                await self._limiter.acquire()
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+                    return True
+                except TelegramRetryAfter as e:
+                    # Telegram просит подождать - притормаживаем всю рассылку, а не только этот запрос
+                    logger.warning(f"Превышен лимит Bot API, пауза {e.retry_after} сек.")
+                    self._limiter.pause(e.retry_after)
+                except TelegramForbiddenError:
+                    return False  # Пользователь заблокировал бота
+                except Exception as e:
+                    logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                    return False
+            return False
+
+    async def _show_progress(self, mailing, text: str):
+        """Обновляет у админа сообщение с прогрессом рассылки."""
+        if not mailing.admin_chat_id or not mailing.progress_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=mailing.admin_chat_id,
+                message_id=mailing.progress_message_id
+            )
+        except TelegramBadRequest:
+            pass  # Текст не изменился или сообщение удалено
+        except Exception as e:
+            logger.error(f"Не удалось обновить прогресс рассылки #{mailing.id}: {e}")
@@ -0,0 +1,198 @@
+import asyncio
+import math
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import requests as rq
+from app.database.cache import catalog_version
+from app.keyboards import builders as kb
+
+# Количество товаров на одной странице каталога
+PAGE_SIZE = 5
+# Сколько лучших результатов поиска запоминать для одного запроса и сколько запросов держать в кэше
+SEARCH_RESULTS_LIMIT = 100
+SEARCH_CACHE_SIZE = 1000
+
+
+# Неизменяемая копия товара для кэша (не привязана к сессии SQLAlchemy)
+@dataclass(frozen=True, slots=True)
+class CatalogProduct:
+    id: int
+    name: str
+    description: str | None
+    price: float
+    photo_id: str
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Снимок каталога: все товары и заранее собранные клавиатуры для каждой страницы."""
+    version: int                              # Версия каталога, для которой построен снимок
+    products: dict[int, CatalogProduct]       # Товары по ID (в порядке добавления)
+    ids: list[int]                            # Отсортированные ID товаров (для поиска страницы по курсору)
+    pages: list[InlineKeyboardMarkup]         # Готовые клавиатуры страниц (индекс 0 - первая страница)
+
+    @property
+    def total_pages(self) -> int:
+        return len(self.pages)
+
+    def page_index(self, cursor: int, forward: bool = True) -> int:
+        """
+        Находит номер страницы (с нуля) по keyset-курсору за O(log n):
+        forward - страница с первым товаром после cursor, иначе - с последним товаром перед cursor.
+        """
+        if forward:
+            position = bisect_right(self.ids, cursor)
+        else:
+            position = bisect_left(self.ids, cursor) - 1
+        position = min(max(position, 0), max(len(self.ids) - 1, 0))
+        return position // PAGE_SIZE
+
+    def page_markup(self, cursor: int = 0, forward: bool = True) -> InlineKeyboardMarkup:
+        """Возвращает готовую клавиатуру страницы, на которую указывает курсор."""
+        return self.pages[self.page_index(cursor, forward)]
+
+    def neighbours(self, product_id: int) -> tuple[int | None, int | None]:
+        """Возвращает ID предыдущего и следующего товара каталога (None, если их нет)."""
+        position = bisect_left(self.ids, product_id)
+        prev_id = self.ids[position - 1] if position > 0 else None
+        next_id = self.ids[position + 1] if position + 1 < len(self.ids) else None
+        return prev_id, next_id
+
+
+# Готовая к отправке карточка товара
+@dataclass(frozen=True, slots=True)
+class ProductCard:
+    photo_id: str
+    caption: str
+    markup: InlineKeyboardMarkup
+
+
+def render_product_card(product: CatalogProduct, prev_id: int | None, next_id: int | None) -> ProductCard:
+    """Формирует подпись к фото и клавиатуру карточки товара."""
+    caption_text = f"<b>{product.name}</b>\n"
+    if product.description:
+        caption_text += f"{product.description}\n\n"
+    caption_text += f"Цена: {int(product.price)} руб."
+    return ProductCard(
+        photo_id=product.photo_id,
+        caption=caption_text,
+        markup=kb.product_detail_keyboard(product.id, prev_id=prev_id, next_id=next_id)
+    )
+
+
+class CatalogCache:
+    """
+    Кэш каталога в памяти. Снимок перестраивается только после изменения товаров
+    (add_product, update_product_*, delete_product увеличивают catalog_version),
+    поэтому листание каталога и просмотр карточек не обращаются к БД.
+    """
+
+    def __init__(self):
+        self._snapshot: CatalogSnapshot | None = None
+        self._lock = asyncio.Lock()  # Чтобы при всплеске запросов снимок строился один раз
+        # Карточки товаров: ID товара -> (ключ актуальности, карточка)
+        self._cards: dict[int, tuple[tuple, ProductCard]] = {}
+        # Результаты поиска: нормализованный запрос -> ID найденных товаров по релевантности.
+        # Действительны для версии каталога search_version, при изменении товаров сбрасываются целиком
+        self._search_results: OrderedDict[str, list[int]] = OrderedDict()
+        self._search_version = catalog_version.value
+
+    async def get(self, session: AsyncSession) -> CatalogSnapshot:
+        """Возвращает актуальный снимок каталога, при необходимости перестраивая его."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == catalog_version.value:
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != catalog_version.value:
+                snapshot = await self._build(session)
+                self._snapshot = snapshot
+        return snapshot
+
+    def product_card(self, snapshot: CatalogSnapshot, product_id: int) -> ProductCard | None:
+        """
+        Возвращает карточку товара из кэша, перестраивая ее, только если изменился сам товар
+        (его версия в catalog_version) или его соседи по каталогу (кнопки перелистывания).
+        """
+        product = snapshot.products.get(product_id)
+        if product is None:
+            self._cards.pop(product_id, None)
+            return None
+        prev_id, next_id = snapshot.neighbours(product_id)
+        key = (catalog_version.product(product_id), prev_id, next_id)
+        cached = self._cards.get(product_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        card = render_product_card(product, prev_id, next_id)
+        self._cards[product_id] = (key, card)
+        return card
+
+    async def search(self, session: AsyncSession, query: str) -> list[CatalogProduct]:
+        """
+        Ищет товары (до SEARCH_RESULTS_LIMIT лучших совпадений) и возвращает их из снимка каталога.
+        Повторный такой же запрос (с точностью до регистра и знаков препинания) не обращается к БД,
+        пока каталог не изменился.
+        """
+        snapshot = await self.get(session)
+        if self._search_version != snapshot.version:
+            self._search_results.clear()
+            self._search_version = snapshot.version
+
+        key = rq.normalize_search_query(query)
+        ids = self._search_results.get(key)
+        if ids is None:
+            rows, _, _ = await rq.search_products(session, key, page_size=SEARCH_RESULTS_LIMIT)
+            ids = [row.id for row in rows]
+            self._search_results[key] = ids
+            if len(self._search_results) > SEARCH_CACHE_SIZE:
+                self._search_results.popitem(last=False)
+        else:
+            self._search_results.move_to_end(key)
+        return [snapshot.products[product_id] for product_id in ids if product_id in snapshot.products]
+
+    def invalidate(self):
+        """Принудительно сбрасывает снимок, карточки товаров и результаты поиска."""
+        self._snapshot = None
+        self._cards.clear()
+        self._search_results.clear()
+
+    @staticmethod
+    async def _build(session: AsyncSession) -> CatalogSnapshot:
+        # Запоминаем версию до чтения, чтобы изменение во время загрузки не потерялось
+        version = catalog_version.value
+        products = [
+            CatalogProduct(
+                id=product.id,
+                name=product.name,
+                description=product.description,
+                price=product.price,
+                photo_id=product.photo_id
+            )
+            for product in await rq.get_all_products(session)
+        ]
+
+        total_pages = max(math.ceil(len(products) / PAGE_SIZE), 1)
+        pages = [
+            kb.catalog_keyboard(
+                products[page * PAGE_SIZE:(page + 1) * PAGE_SIZE],
+                has_prev=page > 0,
+                has_next=page < total_pages - 1
+            )
+            for page in range(total_pages)
+        ]
+        return CatalogSnapshot(
+            version=version,
+            products={product.id: product for product in products},
+            ids=[product.id for product in products],
+            pages=pages
+        )
+
+
+# Общий для всего приложения кэш каталога
+catalog_cache = CatalogCache()
@@ -0,0 +1,203 @@
+import logging
+import math
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Получаем логгер для этого модуля
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: время обработки (в секундах) и число SQL-запросов на обновление
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """Базовая метрика с набором меток. Значения хранятся отдельно для каждой комбинации меток."""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for label_values, value in sorted(self._values.items()):
+            lines.extend(self._render_value(label_values, value))
+        return lines
+
+    def _render_value(self, label_values: tuple, value) -> list[str]:
+        return [f'{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [счетчики по корзинам, сумма, количество]
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def _render_value(self, label_values: tuple, state) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state[0]):
+            cumulative += count
+            labels = _format_labels(self.label_names, label_values, f'le="{_format_value(bound)}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.label_names, label_values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(state[1])}')
+        lines.append(f'{self.name}_count{labels} {state[2]}')
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик приложения, который отдается в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Общий для всего приложения набор метрик
+registry = MetricsRegistry()
+
+HANDLER_DURATION = registry.register(Histogram(
+    'bot_handler_duration_seconds', 'Время обработки обновления (с фильтрами и middleware)', ('handler',)
+))
+HANDLER_IN_FLIGHT = registry.register(Gauge(
+    'bot_handler_in_flight', 'Обновления, которые сейчас обрабатываются', ('handler',)
+))
+HANDLER_EXCEPTIONS = registry.register(Counter(
+    'bot_handler_exceptions_total', 'Исключения при обработке обновлений', ('handler', 'exception')
+))
+UPDATE_SQL_STATEMENTS = registry.register(Histogram(
+    'bot_update_sql_statements', 'SQL-запросов на одно обновление', ('handler',), buckets=SQL_BUCKETS
+))
+SQL_STATEMENTS = registry.register(Counter(
+    'bot_sql_statements_total', 'Все SQL-запросы (включая фоновые задачи)'
+))
+THROTTLED_UPDATES = registry.register(Counter(
+    'bot_throttled_updates_total', 'Обновления, отброшенные антифлудом', ('kind',)
+))
+COALESCED_CALLBACKS = registry.register(Counter(
+    'bot_coalesced_callbacks_total', 'Повторные нажатия, схлопнутые с уже обрабатываемым'
+))
+
+
+@dataclass
+class UpdateStats:
+    """Данные об обрабатываемом обновлении, которые собираются по ходу обработки."""
+    handler: str = 'unhandled'  # Имя функции-хэндлера (заполняется, когда хэндлер выбран)
+    sql_statements: int = 0
+
+
+# Статистика текущего обновления (у каждого обновления свой контекст задачи)
+current_update: ContextVar[UpdateStats | None] = ContextVar('current_update', default=None)
+
+
+def _count_sql_statement(*_):
+    SQL_STATEMENTS.inc()
+    stats = current_update.get()
+    if stats is not None:
+        stats.sql_statements += 1
+
+
+def count_sql_statements(engine: AsyncEngine):
+    """Подключает подсчет SQL-запросов движка к метрикам."""
+    event.listen(engine.sync_engine, 'before_cursor_execute', _count_sql_statement)
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер, отдающий метрики по адресу /metrics."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    @staticmethod
+    async def _handle(request: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.render().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,10 +1,24 @@
+import asyncio
 import logging
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+from aiogram.types import InlineKeyboardMarkup
 from app.config import config
 
 # Получаем логгер для этого модуля
 logger = logging.getLogger(__name__)
 
+# Сколько раз пытаться доставить уведомление одному администратору
+NOTIFY_MAX_ATTEMPTS = 3
+# Начальная пауза между попытками при сетевых ошибках (удваивается с каждой попыткой)
+NOTIFY_RETRY_DELAY = 1
+# Сколько секунд при остановке бота ждать отправки уже поставленных уведомлений
+NOTIFY_SHUTDOWN_TIMEOUT = 10
+
+# Фоновые задачи рассылки уведомлений (храним ссылки, чтобы задачи не удалил сборщик мусора)
+_pending_notifications: set[asyncio.Task] = set()
+
+
 async def notify_developer_of_error(bot: Bot, error_text: str):
     """
     Отправляет сообщение об ошибке разработчику.
@@ -18,4 +32,50 @@ async def notify_developer_of_error(bot: Bot, error_text: str):
         )
     except Exception as e:
         # Если даже уведомление отправить не удалось, логируем эту ошибку
-        logger.error(f"Не удалось отправить уведомление разработчику: {e}")
\ No newline at end of file
+        logger.error(f"Не удалось отправить уведомление разработчику: {e}")
+
+
+async def _send_with_retry(bot: Bot, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup | None) -> bool:
+    """
+    Отправляет уведомление одному получателю, повторяя попытку при лимитах Bot API
+    и временных сетевых ошибках. Никогда не выбрасывает исключений. Возвращает True при успехе.
+    """
+    for attempt in range(1, NOTIFY_MAX_ATTEMPTS + 1):
+        try:
+            await bot.send_message(chat_id, text, reply_markup=reply_markup)
+            return True
+        except TelegramRetryAfter as e:
+            delay = e.retry_after  # Telegram сам сообщает, сколько подождать
+        except (TelegramNetworkError, TelegramServerError) as e:
+            delay = NOTIFY_RETRY_DELAY * 2 ** (attempt - 1)
+            logger.warning(f"Временная ошибка при отправке уведомления {chat_id} (попытка {attempt}): {e}")
+        except Exception as e:
+            # Бот заблокирован, чат не найден и т.п. - повтор не поможет
+            logger.error(f"Не удалось отправить уведомление {chat_id}: {e}")
+            return False
+        if attempt < NOTIFY_MAX_ATTEMPTS:
+            await asyncio.sleep(delay)
+    logger.error(f"Не удалось отправить уведомление {chat_id} после {NOTIFY_MAX_ATTEMPTS} попыток")
+    return False
+
+
+async def _fan_out(bot: Bot, chat_ids: list[int], text: str, reply_markup: InlineKeyboardMarkup | None):
+    """Параллельно отправляет уведомление всем получателям; ошибка одного не мешает остальным."""
+    await asyncio.gather(*(_send_with_retry(bot, chat_id, text, reply_markup) for chat_id in chat_ids))
+
+
+def notify_admins(bot: Bot, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> asyncio.Task:
+    """
+    Ставит уведомление всем администраторам в фоновую задачу и сразу возвращает управление,
+    поэтому ответ пользователю не ждет доставки сообщений админам.
+    """
+    task = asyncio.create_task(_fan_out(bot, list(config.admin_ids), text, reply_markup), name='notify-admins')
+    _pending_notifications.add(task)
+    task.add_done_callback(_pending_notifications.discard)
+    return task
+
+
+async def wait_pending_notifications():
+    """При остановке бота дожидается отправки уже поставленных уведомлений (не дольше NOTIFY_SHUTDOWN_TIMEOUT)."""
+    if _pending_notifications:
+        await asyncio.wait(set(_pending_notifications), timeout=NOTIFY_SHUTDOWN_TIMEOUT)
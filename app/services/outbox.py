@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import requests as rq
+
+# Получаем логгер для этого модуля
+logger = logging.getLogger(__name__)
+
+# Сколько уведомлений забирать из очереди за один раз
+OUTBOX_BATCH_SIZE = 50
+# Максимум одновременных запросов к Bot API
+OUTBOX_CONCURRENCY = 10
+# После скольких неудачных попыток уведомление помечается как 'failed'
+OUTBOX_MAX_ATTEMPTS = 8
+# Пауза перед повтором: начальная (удваивается с каждой попыткой) и максимальная, в секундах
+OUTBOX_RETRY_DELAY = 2
+OUTBOX_MAX_RETRY_DELAY = 600
+# Как часто проверять очередь, если никто не разбудил обработчик (страховка), в секундах
+OUTBOX_IDLE_INTERVAL = 60
+
+
+class OutboxWorker:
+    """
+    Фоновый обработчик очереди уведомлений (таблица outbox). Уведомления записываются
+    в той же транзакции, что и изменение заказа, поэтому не теряются при сбоях Telegram
+    и перезапусках, а хэндлеры не ждут ответа Bot API. Доставка "как минимум один раз":
+    уведомление удаляется из очереди только после успешной отправки.
+    """
+
+    def __init__(self, bot: Bot, session_pool: async_sessionmaker):
+        self.bot = bot
+        self.session_pool = session_pool
+        self._semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Запускает обработчик в фоне (заодно отправит все, что накопилось до перезапуска)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='outbox-worker')
+
+    async def stop(self):
+        """Останавливает обработчик. Неотправленные уведомления останутся в очереди до следующего запуска."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        """Сообщает обработчику, что в очереди появились новые уведомления."""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+                if processed == OUTBOX_BATCH_SIZE:
+                    continue  # Очередь, вероятно, не пуста - сразу берем следующую порцию
+                async with self.session_pool() as session:
+                    next_attempt_at = await rq.get_next_notification_time(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди уведомлений: {e}")
+                next_attempt_at = time.time() + OUTBOX_RETRY_DELAY
+
+            timeout = OUTBOX_IDLE_INTERVAL
+            if next_attempt_at is not None:
+                timeout = min(timeout, max(next_attempt_at - time.time(), 0))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def process_batch(self) -> int:
+        """Отправляет одну порцию уведомлений, которые пора отправить. Возвращает их количество."""
+        async with self.session_pool() as session:
+            messages = await rq.get_due_notifications(session, OUTBOX_BATCH_SIZE)
+        if not messages:
+            return 0
+
+        results = await asyncio.gather(*(self._send(message) for message in messages))
+
+        sent_ids, retries, failed_ids = [], {}, []
+        now = time.time()
+        for message, result in zip(messages, results):
+            if result is True:
+                sent_ids.append(message.id)
+            elif result is False or message.attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                failed_ids.append(message.id)
+                logger.error(f"Уведомление #{message.id} для {message.chat_id} не доставлено")
+            else:
+                backoff = min(OUTBOX_RETRY_DELAY * 2 ** message.attempts, OUTBOX_MAX_RETRY_DELAY)
+                retries[message.id] = now + max(result, backoff)
+
+        async with self.session_pool() as session:
+            await rq.save_notification_results(session, sent_ids, retries, failed_ids)
+        return len(messages)
+
+    async def _send(self, message) -> bool | float:
+        """
+        Отправляет одно уведомление. Возвращает True при успехе, False при ошибке,
+        которую повтор не исправит, или минимальную паузу (в секундах) перед повторной попыткой.
+        """
+        reply_markup = None
+        if message.reply_markup:
+            reply_markup = InlineKeyboardMarkup.model_validate_json(message.reply_markup)
+        async with self._semaphore:
+            try:
+                await self.bot.send_message(chat_id=message.chat_id, text=message.text, reply_markup=reply_markup)
+                return True
+            except TelegramRetryAfter as e:
+                return float(e.retry_after)  # Telegram сам сообщает, сколько подождать
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Временная ошибка при отправке уведомления #{message.id}: {e}")
+                return 0.0
+            except Exception as e:
+                # Бот заблокирован, чат не найден и т.п.
+                logger.error(f"Не удалось отправить уведомление #{message.id} пользователю {message.chat_id}: {e}")
+                return False
@@ -0,0 +1,187 @@
+import asyncio
+import csv
+import re
+import zipfile
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Iterator
+
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import requests as rq
+
+# Сколько строк файла читать и вставлять в БД за одну транзакцию
+IMPORT_BATCH_SIZE = 500
+# Сколько ошибок показывать админу (остальные только считаются)
+MAX_REPORTED_ERRORS = 20
+# Ограничения столбцов таблицы products
+NAME_MAX_LENGTH = 100
+DESCRIPTION_MAX_LENGTH = 255
+
+# Допустимые заголовки столбцов (регистр не важен)
+COLUMN_ALIASES = {
+    'name': ('name', 'название'),
+    'price': ('price', 'цена'),
+    'photo_id': ('photo_id', 'фото'),
+    'description': ('description', 'описание'),
+}
+REQUIRED_COLUMNS = ('name', 'price', 'photo_id')
+
+# File ID Telegram: длинная строка из букв, цифр, "-" и "_" (проверить сам файл без запроса к API нельзя)
+_FILE_ID_PATTERN = re.compile(r'^[\w-]{20,}$')
+# Байты, которые не удалось прочитать как UTF-8 (CSV читается с errors='surrogateescape')
+_UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+
+class ImportFormatError(ValueError):
+    """Файл нельзя импортировать целиком: неизвестный формат или нет обязательных столбцов."""
+    accepted = 0  # Сколько товаров уже добавлено до ошибки (порции сохраняются по мере чтения файла)
+
+
+@dataclass
+class ImportResult:
+    accepted: int = 0  # Добавлено товаров
+    rejected: int = 0  # Отклонено строк
+    errors: list[str] = field(default_factory=list)  # Первые MAX_REPORTED_ERRORS ошибок
+
+    def reject(self, line: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Строка {line}: {reason}")
+
+
+def _read_csv(path: str) -> Iterator[tuple]:
+    """
+    Построчно читает CSV (разделитель - запятая, точка с запятой или табуляция, определяется по началу файла).
+    Если уже начало файла не в UTF-8, файл отклоняется целиком (до вставки первой порции);
+    отдельные строки с некорректными байтами дальше по файлу отклоняются при проверке строк.
+    """
+    with open(path, encoding='utf-8-sig', errors='surrogateescape', newline='') as file:
+        sample = file.read(4096)
+        if _UNDECODABLE.search(sample):
+            raise ImportFormatError("файл должен быть в кодировке UTF-8")
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(file, dialect)
+
+
+def _read_xlsx(path: str) -> Iterator[tuple]:
+    """Построчно читает первый лист xlsx в режиме read-only (книга не загружается в память целиком)."""
+    try:
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise ImportFormatError("не удалось открыть xlsx-файл")
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _cell(values: tuple, index: int | None) -> str:
+    if index is None or index >= len(values) or values[index] is None:
+        return ''
+    return str(values[index]).strip()
+
+
+def _parse_row(values: tuple, columns: dict[str, int]) -> dict | str:
+    """Проверяет строку файла. Возвращает данные товара или текст ошибки."""
+    name = _cell(values, columns['name'])
+    if not name:
+        return "не указано название"
+    if len(name) > NAME_MAX_LENGTH:
+        return f"название длиннее {NAME_MAX_LENGTH} символов"
+
+    price_text = _cell(values, columns['price']).replace(' ', '').replace(',', '.')
+    try:
+        price = Decimal(price_text)
+    except InvalidOperation:
+        return f"некорректная цена «{price_text}»"
+    if not price.is_finite() or price <= 0:
+        return f"некорректная цена «{price_text}»"
+
+    photo_id = _cell(values, columns['photo_id'])
+    if not _FILE_ID_PATTERN.match(photo_id):
+        return "некорректный file ID фото"
+
+    description = _cell(values, columns.get('description')) or None
+    if description and len(description) > DESCRIPTION_MAX_LENGTH:
+        return f"описание длиннее {DESCRIPTION_MAX_LENGTH} символов"
+
+    return {'name': name, 'price': float(price), 'photo_id': photo_id, 'description': description}
+
+
+def _parse_file(path: str, extension: str) -> Iterator[tuple[int, dict | str]]:
+    """
+    Генератор проверенных строк файла: (номер строки, данные товара или текст ошибки).
+    Первая строка - заголовки, пустые строки пропускаются.
+    """
+    if extension == 'csv':
+        rows = _read_csv(path)
+    elif extension == 'xlsx':
+        rows = _read_xlsx(path)
+    else:
+        raise ImportFormatError(f"неподдерживаемый формат .{extension}")
+
+    header = next(rows, None) or ()
+    titles = [_cell(header, index).lower() for index in range(len(header))]
+    columns = {
+        column: next((index for index, title in enumerate(titles) if title in aliases), None)
+        for column, aliases in COLUMN_ALIASES.items()
+    }
+    missing = [column for column in REQUIRED_COLUMNS if columns[column] is None]
+    if missing:
+        raise ImportFormatError(f"нет обязательных столбцов: {', '.join(missing)}")
+
+    for line, values in enumerate(rows, start=2):
+        if not any(_cell(values, index) for index in range(len(values))):
+            continue
+        if any(isinstance(value, str) and _UNDECODABLE.search(value) for value in values):
+            yield line, "строка не в кодировке UTF-8"
+            continue
+        yield line, _parse_row(values, columns)
+
+
+def _next_batch(rows: Iterator, size: int) -> list:
+    """Читает из генератора очередную порцию строк (выполняется в отдельном потоке)."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+async def import_products(session: AsyncSession, path: str, extension: str) -> ImportResult:
+    """
+    Импортирует товары из CSV или xlsx-файла (столбцы: название, цена, фото, описание).
+
+    Файл читается и проверяется в отдельном потоке порциями по IMPORT_BATCH_SIZE строк,
+    каждая порция вставляется одной транзакцией, поэтому в памяти одновременно находится
+    только одна порция, а цикл событий бота не блокируется разбором файла.
+    Выбрасывает ImportFormatError, если файл нельзя импортировать целиком; если ошибка
+    обнаружилась уже после сохранения части порций, их количество передается в e.accepted.
+    """
+    result = ImportResult()
+    rows = _parse_file(path, extension)
+    try:
+        while batch := await asyncio.to_thread(_next_batch, rows, IMPORT_BATCH_SIZE):
+            products = []
+            for line, parsed in batch:
+                if isinstance(parsed, str):
+                    result.reject(line, parsed)
+                else:
+                    products.append(parsed)
+            if products:
+                await rq.add_products(session, products)
+                result.accepted += len(products)
+    except ImportFormatError as e:
+        e.accepted = result.accepted
+        raise
+    finally:
+        rows.close()  # Закрываем файл, если импорт прерван ошибкой
+    return result
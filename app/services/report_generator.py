@@ -1,82 +1,123 @@
-from io import BytesIO
-from datetime import datetime
+import asyncio
+import json
+import tempfile
 from collections import defaultdict
 
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.models import Order, User, OrderItem
+from app.database import requests as rq
 from app.lexicon.lexicon_ru import ORDER_STATUSES
 
-def create_orders_excel_report(orders_with_users: list[tuple[Order, User]], all_items: list[OrderItem]) -> BytesIO:
-    """
-    Создает Excel-отчет по заказам и возвращает его как объект BytesIO (файл в памяти).
-    
-    :param orders_with_users: Список кортежей (Order, User), результат запроса из БД.
-    :param all_items: Список всех заказанных товаров (OrderItem) для всех заказов.
-    :return: Объект BytesIO с готовым Excel-файлом.
-    """
-    
+# Сколько заказов читать из БД за один запрос
+REPORT_CHUNK_SIZE = 1000
+
+# Заголовки столбцов отчета
+HEADERS = [
+    "ID Заказа", "Статус", "TG ID", "Username", "ФИО Получателя",
+    "Телефон", "ПВЗ СДЭК", "Трек-номер СДЭК", "Состав заказа", "Сумма заказа (руб.)"
+]
+
+
+def _cell_width(value) -> int:
+    """Ширина значения для подбора ширины столбца (по первой строке, актуально для состава заказа)."""
+    return len(str(value).split('\n')[0])
+
+
+def _build_rows(orders: list, items: list) -> list[list]:
+    """Формирует строки отчета для порции заказов."""
     # Группируем товары по ID заказа для быстрого доступа
     items_by_order_id = defaultdict(list)
-    for item in all_items:
+    for item in items:
         items_by_order_id[item.order_id].append(item)
 
-    # Создаем новую книгу Excel
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Отчет по заказам"
-
-    # Определяем заголовки столбцов
-    headers = [
-        "ID Заказа", "Статус", "TG ID", "Username", "ФИО Получателя",
-        "Телефон", "ПВЗ СДЭК", "Трек-номер СДЭК", "Состав заказа", "Сумма заказа (руб.)"
-    ]
-    sheet.append(headers)
-
-    # Применяем стили к заголовкам (жирный шрифт, выравнивание по центру)
-    header_font = Font(bold=True)
-    for cell in sheet[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')
-
-    # Заполняем строки данными по каждому заказу
-    for order, user in orders_with_users:
-        # Получаем товары для текущего заказа
+    rows = []
+    for order in orders:
         order_items = items_by_order_id.get(order.id, [])
-        
+
         # Формируем строку с составом заказа (каждый товар с новой строки)
-        items_str_list = [f"{item.product_name} ({int(item.product_price)} руб.)" for item in order_items]
-        items_str = "\n".join(items_str_list)
-        
-        # Считаем общую сумму заказа
-        total_price = sum(item.product_price for item in order_items)
-
-        # Формируем строку для записи в Excel
-        row_data = [
+        items_str = "\n".join(
+            f"{item.product_name} x{item.quantity} ({int(item.product_price * item.quantity)} руб.)"
+            for item in order_items
+        )
+        rows.append([
             order.id,
-            ORDER_STATUSES.get(order.status, order.status), # Текстовый статус
-            user.tg_id,
-            user.username or "N/A",
+            ORDER_STATUSES.get(order.status, order.status),  # Текстовый статус
+            order.tg_id,
+            order.username or "N/A",
             order.recipient_full_name or "N/A",
             order.recipient_phone_number or "N/A",
             order.delivery_pickup_point or "N/A",
             order.cdek_track_number or "N/A",
             items_str,
-            int(total_price)
-        ]
-        sheet.append(row_data)
-
-    # Автоматически подбираем ширину столбцов по самому длинному значению
-    for column_cells in sheet.columns:
-        # Берем длину первой строки в ячейке (актуально для состава заказа)
-        length = max(len(str(cell.value).split('\n')[0]) for cell in column_cells)
-        # Устанавливаем ширину с небольшим запасом
-        sheet.column_dimensions[column_cells[0].column_letter].width = length + 4
-
-    # Сохраняем книгу Excel в объект BytesIO в памяти
-    file_in_memory = BytesIO()
-    workbook.save(file_in_memory)
-    file_in_memory.seek(0)  # Перемещаем "курсор" в начало файла
-    
-    return file_in_memory
\ No newline at end of file
+            int(order.total_amount)
+        ])
+    return rows
+
+
+def _spool_rows(spool, orders: list, items: list, widths: list[int]):
+    """Формирует строки порции заказов, дописывает их во временный файл (JSON Lines) и обновляет ширину столбцов."""
+    for row in _build_rows(orders, items):
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], _cell_width(value))
+        spool.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def _write_workbook(spool, widths: list[int]) -> str:
+    """
+    Собирает xlsx-файл в режиме write-only: строки читаются из временного файла
+    и сразу пишутся на диск, поэтому в памяти не держится весь отчет.
+    Возвращает путь к готовому файлу.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Отчет по заказам")
+
+    # В write-only режиме ширину столбцов нужно задать до записи строк
+    for index, width in enumerate(widths, start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width + 4
+
+    # Заголовки с жирным шрифтом и выравниванием по центру
+    header_cells = []
+    for header in HEADERS:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        header_cells.append(cell)
+    sheet.append(header_cells)
+
+    spool.seek(0)
+    for line in spool:
+        sheet.append(json.loads(line))
+
+    report_file = tempfile.NamedTemporaryFile(prefix='orders_report_', suffix='.xlsx', delete=False)
+    report_file.close()
+    workbook.save(report_file.name)
+    return report_file.name
+
+
+async def create_orders_excel_report(session: AsyncSession) -> str | None:
+    """
+    Создает Excel-отчет по заказам и возвращает путь к временному xlsx-файлу
+    (файл нужно удалить после отправки) или None, если заказов нет.
+
+    Заказы читаются из БД порциями по REPORT_CHUNK_SIZE (keyset по ID) и сразу
+    сбрасываются во временный файл, а сборка книги выполняется в отдельном потоке,
+    чтобы не блокировать цикл событий бота и не держать весь отчет в памяти.
+    """
+    widths = [len(header) for header in HEADERS]
+    with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as spool:
+        cursor = 0
+        while True:
+            orders = await rq.get_orders_for_report(session, cursor, REPORT_CHUNK_SIZE)
+            if not orders:
+                break
+            items = await rq.get_items_for_orders(session, [order.id for order in orders])
+            await asyncio.to_thread(_spool_rows, spool, orders, items, widths)
+            cursor = orders[-1].id
+
+        if cursor == 0:
+            return None  # Нет ни одного заказа
+        return await asyncio.to_thread(_write_workbook, spool, widths)
@@ -0,0 +1,15 @@
+"""
+Бенчмарки хэндлеров бота. Запуск: python -m benchmarks.handlers --help
+
+Настройки приложения читаются при импорте app.config, поэтому для запуска без .env
+обязательные параметры подставляются здесь (уже заданные переменные окружения не меняются).
+Эти же значения использует tests/conftest.py.
+"""
+import os
+
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ.setdefault('ADMIN_IDS', '[1]')
+os.environ.setdefault('DEVELOPER_ID', '1')
+os.environ.setdefault('SUPPORT_USERNAME', 'benchmark')
+os.environ.setdefault('BANK_CARD_NUMBER', '0000 0000 0000 0000')
+os.environ.setdefault('BANK_CARD_OWNER', 'Benchmark')
@@ -0,0 +1,345 @@
+"""
+Бенчмарк хэндлеров через настоящий Dispatcher.
+
+Собирает диспетчер так же, как бот (app.bot.create_dispatcher), на временной базе SQLite
+с тестовыми данными и подменяет сессию Bot API на MockedSession. Обновления подаются
+через dp.feed_update, для каждого сценария измеряются задержка (p50/p95/p99),
+количество SQL-запросов и вызовов Bot API на одно обновление. Результат - JSON,
+который удобно сравнивать между запусками:
+
+    python -m benchmarks.handlers --iterations 200 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import aiogram
+import sqlalchemy
+from aiogram import Bot
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.mocked_session import MockedSession
+from app.bot import create_dispatcher
+from app.config import config
+from app.database import requests as rq
+from app.database.engine import create_engine
+from app.database.migrations import run_migrations
+from app.database.query_budget import count_queries, track_queries
+from app.database.models import User, Product, Order, OrderItem
+from app.keyboards.builders import AddToCart, ViewProduct
+
+ORDER_STATUSES = ('new', 'paid', 'processing', 'shipped', 'completed', 'canceled')
+
+
+@dataclass
+class Context:
+    """Данные, из которых сценарии собирают обновления."""
+    user_ids: list[int]   # Telegram ID покупателей
+    product_ids: list[int]
+    admin_id: int
+
+
+@dataclass
+class Scenario:
+    name: str
+    # По номеру итерации возвращает (подготовительные обновления, измеряемое обновление)
+    build: Callable[[Context, int], tuple[list[dict], dict]]
+    iterations_divisor: int = 1  # Во сколько раз меньше итераций (для тяжелых сценариев)
+
+
+# --- Сборка обновлений ---
+
+def _user(tg_id: int) -> dict:
+    return {'id': tg_id, 'is_bot': False, 'first_name': f'User {tg_id}', 'username': f'user{tg_id}'}
+
+
+def _message(tg_id: int, text: str | None = None, photo: bool = False) -> dict:
+    message = {
+        'message_id': 1,
+        'date': int(time.time()),
+        'chat': {'id': tg_id, 'type': 'private'},
+        'from': _user(tg_id)
+    }
+    if photo:
+        message['photo'] = [{'file_id': 'photo', 'file_unique_id': 'photo', 'width': 1, 'height': 1}]
+        message['caption'] = text
+    else:
+        message['text'] = text
+    return message
+
+
+def callback_update(tg_id: int, data: str, photo: bool = False) -> dict:
+    return {'callback_query': {
+        'id': 'bench',
+        'from': _user(tg_id),
+        'chat_instance': 'bench',
+        'data': data,
+        'message': _message(tg_id, 'Сообщение бота', photo=photo)
+    }}
+
+
+def message_update(tg_id: int, text: str) -> dict:
+    return {'message': _message(tg_id, text)}
+
+
+# --- Сценарии ---
+
+def _customer(ctx: Context, i: int) -> int:
+    return ctx.user_ids[i % len(ctx.user_ids)]
+
+
+def _product(ctx: Context, i: int) -> int:
+    return ctx.product_ids[i % len(ctx.product_ids)]
+
+
+def catalog(ctx: Context, i: int):
+    return [], callback_update(_customer(ctx, i), 'catalog')
+
+
+def product_detail(ctx: Context, i: int):
+    return [], callback_update(_customer(ctx, i), ViewProduct(product_id=_product(ctx, i)).pack(), photo=True)
+
+
+def add_to_cart(ctx: Context, i: int):
+    return [], callback_update(_customer(ctx, i), AddToCart(product_id=_product(ctx, i)).pack(), photo=True)
+
+
+def my_cart(ctx: Context, i: int):
+    return [], callback_update(_customer(ctx, i), 'my_cart')
+
+
+def checkout(ctx: Context, i: int):
+    """Измеряется последний шаг - создание заказа после ввода телефона."""
+    tg_id = _customer(ctx, i)
+    prepare = [
+        callback_update(tg_id, AddToCart(product_id=_product(ctx, i)).pack(), photo=True),
+        callback_update(tg_id, 'checkout'),
+        message_update(tg_id, 'ПВЗ СДЭК, ул. Тестовая, 1'),
+        message_update(tg_id, 'Иванов Иван Иванович')
+    ]
+    return prepare, message_update(tg_id, '+79991234567')
+
+
+def admin_list_orders(ctx: Context, i: int):
+    return [], callback_update(ctx.admin_id, 'admin_list_orders')
+
+
+def admin_report(ctx: Context, i: int):
+    return [], callback_update(ctx.admin_id, 'admin_report')
+
+
+SCENARIOS = [
+    Scenario('catalog', catalog),
+    Scenario('product_detail', product_detail),
+    Scenario('add_to_cart', add_to_cart),
+    Scenario('my_cart', my_cart),
+    Scenario('checkout', checkout),
+    Scenario('admin_list_orders', admin_list_orders),
+    Scenario('admin_report', admin_report, iterations_divisor=20),
+]
+
+
+# --- Подготовка базы ---
+
+async def seed(session_maker: async_sessionmaker, users: int, products: int, orders: int) -> Context:
+    """Заполняет базу тестовыми пользователями, товарами и заказами."""
+    rnd = random.Random(42)
+    async with session_maker() as session:
+        await session.execute(insert(User), [
+            {'id': i, 'tg_id': 1_000_000 + i, 'username': f'user{1_000_000 + i}'} for i in range(1, users + 1)
+        ])
+        await session.execute(insert(Product), [
+            {'id': i, 'name': f'Товар {i}', 'description': f'Описание товара {i}',
+             'price': rnd.randint(100, 5000), 'photo_id': f'photo{i}'}
+            for i in range(1, products + 1)
+        ])
+        order_rows, item_rows = [], []
+        for order_id in range(1, orders + 1):
+            items = [
+                {'order_id': order_id, 'product_name': f'Товар {rnd.randint(1, products)}',
+                 'product_price': rnd.randint(100, 5000), 'quantity': rnd.randint(1, 3)}
+                for _ in range(rnd.randint(1, 4))
+            ]
+            item_rows.extend(items)
+            order_rows.append({
+                'id': order_id,
+                'user_id': rnd.randint(1, users),
+                'status': rnd.choice(ORDER_STATUSES),
+                'delivery_pickup_point': 'ПВЗ СДЭК',
+                'recipient_full_name': 'Иванов Иван Иванович',
+                'recipient_phone_number': '+79991234567',
+                'total_amount': sum(item['product_price'] * item['quantity'] for item in items),
+                'item_count': sum(item['quantity'] for item in items)
+            })
+        await session.execute(insert(Order), order_rows)
+        await session.execute(insert(OrderItem), item_rows)
+        await session.commit()
+        await rq.rebuild_stats(session)
+
+    return Context(
+        user_ids=[1_000_000 + i for i in range(1, users + 1)],
+        product_ids=list(range(1, products + 1)),
+        admin_id=config.admin_ids[0]
+    )
+
+
+# --- Измерения ---
+
+def percentile(values: list[float], p: float) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+async def run_scenario(dp, bot: Bot, session: MockedSession, ctx: Context,
+                       scenario: Scenario, iterations: int, warmup: int) -> dict:
+    iterations = max(iterations // scenario.iterations_divisor, 1)
+    latencies, sql_counts, duplicate_counts, api_counts = [], [], [], []
+    duplicates: Counter[str] = Counter()
+    api_methods: Counter[str] = Counter()
+    errors = 0
+    update_id = 0
+
+    async def feed(raw: dict):
+        nonlocal update_id
+        update_id += 1
+        update = Update.model_validate({'update_id': update_id, **raw}, context={'bot': bot})
+        return await dp.feed_update(bot, update)
+
+    for i in range(warmup + iterations):
+        prepare, measured = scenario.build(ctx, i)
+        for raw in prepare:
+            await feed(raw)
+
+        session.reset()
+        with count_queries() as query_log:
+            started = time.perf_counter()
+            try:
+                result = await feed(measured)
+                if result is UNHANDLED:
+                    errors += 1
+            except Exception as e:
+                logging.error(f"Сценарий {scenario.name}: {e!r}")
+                errors += 1
+            elapsed = (time.perf_counter() - started) * 1000
+        calls = session.reset()
+
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        sql_counts.append(query_log.count)
+        update_duplicates = query_log.duplicates()
+        duplicate_counts.append(sum(count - 1 for count in update_duplicates.values()))
+        duplicates.update(' '.join(sql.split()) for sql in update_duplicates)
+        api_counts.append(sum(calls.values()))
+        api_methods.update(calls)
+
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'max': round(max(latencies), 3)
+        },
+        'sql_per_update': round(sum(sql_counts) / len(sql_counts), 2),
+        'max_sql_per_update': max(sql_counts),
+        # Полностью повторяющиеся запросы внутри одного обновления (лишние обращения к БД)
+        'duplicate_sql_per_update': round(sum(duplicate_counts) / len(duplicate_counts), 2),
+        'duplicate_statements': dict(duplicates.most_common(5)),
+        'api_calls_per_update': round(sum(api_counts) / len(api_counts), 2),
+        'api_methods': {name: round(count / iterations, 2) for name, count in sorted(api_methods.items())}
+    }
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix='bot_bench_') as tmp_dir:
+        config.database_url = f"sqlite+aiosqlite:///{Path(tmp_dir) / 'bench.db'}"
+        # Фоновый сброс FSM-состояний не относится к конкретному обновлению - откладываем его до конца прогона
+        config.fsm_flush_interval = 3600
+        # Антифлуд отбрасывал бы повторные действия тех же пользователей - измеряем сами хэндлеры
+        config.throttle_message_rate = config.throttle_callback_rate = config.throttle_write_rate = 1e9
+
+        engine = create_engine()
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        await run_migrations(engine)
+        ctx = await seed(session_maker, args.users, args.products, args.orders)
+
+        track_queries(engine)
+
+        session = MockedSession()
+        bot = Bot(token=config.bot_token.get_secret_value(), session=session)
+        dp = create_dispatcher(bot, session_maker)
+
+        selected = set(args.scenarios or [scenario.name for scenario in SCENARIOS])
+        results = {}
+        try:
+            for scenario in SCENARIOS:
+                if scenario.name in selected:
+                    results[scenario.name] = await run_scenario(
+                        dp, bot, session, ctx, scenario, args.iterations, args.warmup
+                    )
+        finally:
+            await dp.fsm.storage.close()
+            await engine.dispose()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'aiogram': aiogram.__version__,
+            'sqlalchemy': sqlalchemy.__version__,
+            'sqlite': sqlite3.sqlite_version,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'users': args.users,
+            'products': args.products,
+            'orders': args.orders
+        },
+        'scenarios': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хэндлеров бота через Dispatcher.feed_update")
+    parser.add_argument('--iterations', type=int, default=200, help="Измеряемых обновлений на сценарий")
+    parser.add_argument('--warmup', type=int, default=5, help="Неизмеряемых обновлений перед замером")
+    parser.add_argument('--users', type=int, default=1000, help="Пользователей в тестовой базе")
+    parser.add_argument('--products', type=int, default=50, help="Товаров в тестовой базе")
+    parser.add_argument('--orders', type=int, default=5000, help="Заказов в тестовой базе")
+    parser.add_argument('--scenario', dest='scenarios', action='append',
+                        choices=[scenario.name for scenario in SCENARIOS],
+                        help="Запустить только указанный сценарий (можно повторять)")
+    parser.add_argument('--output', help="Файл для JSON-результата (по умолчанию - stdout)")
+    args = parser.parse_args()
+
+    # Логи каждого обновления искажают замеры
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + '\n', encoding='utf-8')
+    else:
+        sys.stdout.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message
+
+
+class MockedSession(BaseSession):
+    """
+    Сессия Bot API без сети: запоминает вызванные методы и возвращает правдоподобный ответ
+    (True для методов, возвращающих bool, иначе - сообщение в том же чате).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter[str] = Counter()
+        self._message_id = 0
+
+    def reset(self) -> Counter[str]:
+        """Возвращает накопленные вызовы и начинает подсчет заново."""
+        calls, self.calls = self.calls, Counter()
+        return calls
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        self.calls[method.__api_method__] += 1
+        if method.__returning__ is bool:
+            return True
+        self._message_id += 1
+        return Message(
+            message_id=self._message_id,
+            date=datetime.now(),
+            chat=Chat(id=getattr(method, 'chat_id', None) or 0, type='private'),
+            text=getattr(method, 'text', None)
+        )
+
+    async def stream_content(self, url: str, headers: dict[str, Any] | None = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b''
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,73 @@
+"""
+Общие фикстуры тестов. Запуск: python -m pytest
+
+Хэндлеры проверяются через настоящий Dispatcher (app.bot.create_dispatcher) на временной
+базе SQLite с тестовыми данными, сессия Bot API подменена на MockedSession из бенчмарков.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Iterator
+
+# Пакет benchmarks при импорте подставляет обязательные параметры конфига для запуска без .env,
+# поэтому он импортируется раньше app.config
+import benchmarks  # noqa: F401
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from app.bot import create_dispatcher
+from app.config import config
+from app.database.engine import create_engine
+from app.database.migrations import run_migrations
+from app.database.query_budget import QueryLog, count_queries, track_queries
+from benchmarks.handlers import Context, seed
+from benchmarks.mocked_session import MockedSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+
+@dataclass
+class Shop:
+    """Собранный бот на тестовой базе: диспетчер, бот без сети и тестовые данные."""
+    loop: asyncio.AbstractEventLoop
+    dp: Dispatcher
+    bot: Bot
+    session_maker: async_sessionmaker
+    ctx: Context
+
+    def feed(self, update: dict):
+        """Синхронно обрабатывает одно обновление (словарь в формате Bot API без update_id)."""
+        self.loop.run_until_complete(
+            self.dp.feed_update(self.bot, Update.model_validate({'update_id': 1, **update}))
+        )
+
+
+# Роутеры - общие объекты модулей и подключаются к диспетчеру один раз, поэтому бот собирается на всю сессию
+@pytest.fixture(scope='session')
+def shop(tmp_path_factory) -> Iterator[Shop]:
+    config.database_url = f"sqlite+aiosqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}"
+    # Фоновый сброс FSM-состояний не относится к проверяемому обновлению
+    config.fsm_flush_interval = 3600
+
+    loop = asyncio.new_event_loop()
+    engine = create_engine()
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    loop.run_until_complete(run_migrations(engine))
+    ctx = loop.run_until_complete(seed(session_maker, users=5, products=5, orders=3))
+    track_queries(engine)
+
+    bot = Bot(token=config.bot_token.get_secret_value(), session=MockedSession())
+    dp = create_dispatcher(bot, session_maker)
+    try:
+        yield Shop(loop=loop, dp=dp, bot=bot, session_maker=session_maker, ctx=ctx)
+    finally:
+        loop.run_until_complete(dp.fsm.storage.close())
+        loop.run_until_complete(engine.dispose())
+        loop.close()
+
+
+@pytest.fixture
+def query_log() -> Iterator[QueryLog]:
+    """Считает SQL-запросы всего теста (после подготовки фикстур, запрошенных раньше): query_log.assert_budget(n)."""
+    with count_queries() as log:
+        yield log
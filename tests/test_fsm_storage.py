@@ -0,0 +1,35 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app.database.fsm_storage import SQLiteStorage, _Record
+
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_eviction_during_flush_keeps_pending_states(shop):
+    async def scenario():
+        storage = SQLiteStorage(shop.session_maker, flush_interval=3600, cache_size=1)
+        for user_id in (101, 102, 103):
+            await storage.set_state(_key(user_id), f'Checkout:step_{user_id}')
+
+        flush = asyncio.create_task(storage.flush())
+        await asyncio.sleep(0)  # Сброс дошел до первой записи в БД и ждет ее
+        # Промах кэша у другого пользователя во время сброса (как в _get_record)
+        storage._cache.setdefault(storage._build_key(_key(104)), _Record())
+        storage._evict()
+        await flush
+        await storage.close()
+
+        # Новое хранилище читает состояния только из БД
+        fresh = SQLiteStorage(shop.session_maker, flush_interval=3600)
+        states = [await fresh.get_state(_key(user_id)) for user_id in (101, 102, 103)]
+        for user_id in (101, 102, 103):
+            await fresh.set_state(_key(user_id), None)
+        await fresh.close()
+        return states
+
+    states = shop.loop.run_until_complete(scenario())
+    assert states == ['Checkout:step_101', 'Checkout:step_102', 'Checkout:step_103']
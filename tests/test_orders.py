@@ -0,0 +1,28 @@
+from sqlalchemy import select
+
+from app.database import requests as rq
+from app.database.models import Order, OutboxMessage
+
+
+def test_ship_order_saves_track_number_with_status_and_notification(shop):
+    async def scenario():
+        async with shop.session_maker() as session:
+            outbox_before = len((await session.scalars(select(OutboxMessage.id))).all())
+            commits = 0
+            commit = session.commit
+
+            async def counting_commit():
+                nonlocal commits
+                commits += 1
+                await commit()
+
+            session.commit = counting_commit
+            await rq.update_order_status(session, 2, 'shipped', notification='shipped', cdek_track_number='1234567890')
+
+        async with shop.session_maker() as session:
+            order = await session.get(Order, 2)
+            outbox_after = len((await session.scalars(select(OutboxMessage.id))).all())
+            return commits, order.status, order.cdek_track_number, outbox_after - outbox_before
+
+    # Трек-номер, статус и уведомление сохраняются одной транзакцией
+    assert shop.loop.run_until_complete(scenario()) == (1, 'shipped', '1234567890', 1)
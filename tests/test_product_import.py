@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import text
+
+from app.services.product_import import import_products, ImportFormatError
+
+PHOTO_ID = 'AgACAgIAAxkBAAIB' + 'x' * 40
+
+
+def _write_csv(path, rows: list[bytes]):
+    path.write_bytes(b'name,price,photo_id\n' + b''.join(rows))
+
+
+def _import(shop, path):
+    async def scenario():
+        async with shop.session_maker() as session:
+            try:
+                return await import_products(session, str(path), 'csv')
+            finally:
+                # Убираем импортированные товары, чтобы не влиять на остальные тесты
+                await session.execute(text(
+                    "DELETE FROM products_fts WHERE rowid IN (SELECT id FROM products WHERE name LIKE 'Import %')"
+                ))
+                await session.execute(text("DELETE FROM products WHERE name LIKE 'Import %'"))
+                await session.commit()
+
+    return shop.loop.run_until_complete(scenario())
+
+
+def test_undecodable_row_is_rejected_without_aborting_import(shop, tmp_path):
+    path = tmp_path / 'products.csv'
+    rows = [f'Import {i},100,{PHOTO_ID}\n'.encode() for i in range(1200)]
+    rows.insert(1100, b'Import \xff,100,' + PHOTO_ID.encode() + b'\n')
+    _write_csv(path, rows)
+
+    result = _import(shop, path)
+    assert result.accepted == 1200
+    assert result.rejected == 1
+    assert result.errors == ["Строка 1102: строка не в кодировке UTF-8"]
+
+
+def test_non_utf8_file_is_rejected_before_insert(shop, tmp_path):
+    path = tmp_path / 'products.csv'
+    _write_csv(path, [f'Import {i},100,{PHOTO_ID}\n'.encode('cp1251') for i in range(10)] + ['Товар,1,x\n'.encode('cp1251')] * 5)
+
+    with pytest.raises(ImportFormatError) as error:
+        _import(shop, path)
+    assert error.value.accepted == 0
@@ -0,0 +1,28 @@
+from app.database.query_budget import query_budget
+from app.keyboards.builders import ChangeStatus, ViewOrder
+from benchmarks.handlers import callback_update
+
+
+def _order_items_queries(log) -> int:
+    """Сколько раз за обновление читался состав заказа (get_order_details)."""
+    return sum('FROM order_items' in sql for sql, _ in log.statements)
+
+
+def test_view_order_budget(shop, query_log):
+    shop.feed(callback_update(shop.ctx.admin_id, ViewOrder(order_id=1).pack()))
+
+    # Состояние FSM, заказ, состав заказа
+    query_log.assert_budget(3)
+    assert _order_items_queries(query_log) == 1
+
+
+def test_change_order_status_budget(shop):
+    update = callback_update(shop.ctx.admin_id, ChangeStatus(order_id=1, new_status='processing').pack())
+    # Состояние FSM, статус и сумма заказа, смена статуса, счетчики статистики,
+    # получатель уведомления, запись в outbox, детали заказа и его состав
+    with query_budget(8) as log:
+        shop.feed(update)
+
+    # Детали заказа после смены статуса читаются один раз, без повторов и N+1
+    assert _order_items_queries(log) == 1
+    assert not log.repeated()
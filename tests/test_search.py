@@ -0,0 +1,19 @@
+from sqlalchemy import text
+
+from app.database import requests as rq
+from app.services.catalog import catalog_cache
+
+
+def test_rebuild_search_index_resets_cached_results(shop):
+    async def scenario():
+        async with shop.session_maker() as session:
+            # Индекс разошелся с товарами - поиск ничего не находит, и этот результат попадает в кэш
+            await session.execute(text("DELETE FROM products_fts"))
+            await session.commit()
+            assert await catalog_cache.search(session, 'товар') == []
+
+            await rq.rebuild_search_index(session)
+            return await catalog_cache.search(session, 'товар')
+
+    found = shop.loop.run_until_complete(scenario())
+    assert sorted(product.id for product in found) == shop.ctx.product_ids
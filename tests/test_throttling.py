@@ -0,0 +1,32 @@
+from aiogram import Bot
+from aiogram.types import Update
+
+from app.middlewares import RateLimit, ThrottlingMiddleware
+from benchmarks.handlers import message_update
+from benchmarks.mocked_session import MockedSession
+
+
+def test_throttled_checkout_message_is_answered_once(shop):
+    throttling = ThrottlingMiddleware(
+        message_limit=RateLimit(rate=1, burst=5),
+        callback_limit=RateLimit(rate=1, burst=5),
+        write_limit=RateLimit(rate=0.001, burst=1),
+        write_states=['Checkout:'],
+    )
+    session = MockedSession()
+    bot = Bot(token='123456:TEST', session=session)
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.text)
+
+    async def scenario():
+        for text in ('ПВЗ', '+79990000000', 'Иванов Иван', 'еще раз'):
+            message = Update.model_validate({'update_id': 1, **message_update(42, text)}).message.as_(bot)
+            data = {'event_from_user': message.from_user, 'raw_state': 'Checkout:waiting_for_phone'}
+            await throttling(handler, message, data)
+
+    shop.loop.run_until_complete(scenario())
+    # Первое сообщение обработано, на первое отброшенное пришел ответ, дальше - без ответов
+    assert handled == ['ПВЗ']
+    assert session.calls['sendMessage'] == 1